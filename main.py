@@ -24,22 +24,39 @@ Entry Points:
 """
 
 import os
+import codecs
+import difflib
+import gzip
+import hashlib
+import hmac
+import io
 import json
 import logging
+import re
+import string
+import threading
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from typing import TypedDict
 
 import base64
 
 import functions_framework
+import orjson
 from cloudevents.http import CloudEvent
 from google import genai
+from google.genai import types
 from google.cloud import storage
 from google.cloud import pubsub_v1
-from google.api_core.exceptions import PreconditionFailed
+from google.api_core import exceptions
+from google.api_core.exceptions import NotFound, PreconditionFailed
 
 
 # =============================================================================
@@ -56,7 +73,7 @@ def timed_operation():
     Example:
         with timed_operation() as elapsed:
             response = requests.get(url)
-            logger.info(f"Request completed in {elapsed():.0f}ms")
+            logger.info("Request completed in %.0fms", elapsed())
     """
     start_time = time.time()
     yield lambda: (time.time() - start_time) * 1000
@@ -72,6 +89,7 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 
 # =============================================================================
@@ -115,6 +133,124 @@ def load_config() -> tuple[dict, list]:
 # Azure DevOps API Client
 # =============================================================================
 
+FILE_CACHE_MAX_ENTRY_CHARS = 256 * 1024  # Larger files are fetched every time
+FILE_CACHE_MAX_TOTAL_CHARS = 64 * 1024 * 1024  # Keeps the cache well inside function memory
+
+CACHE_MISS = object()  # Sentinel: None is a valid cached value ("file not found")
+
+
+class FileContentCache:
+    """Size-bounded, thread-safe cache of commit-pinned file contents.
+    
+    File contents at a commit never change, so entries stay valid for the
+    life of the process. When the total size limit is reached the least
+    recently used entries are evicted first, so files that every re-review
+    of a PR reads again (unchanged target-branch versions) stay cached.
+    """
+    
+    def __init__(self, max_total_chars: int, max_entry_chars: int):
+        self.max_total_chars = max_total_chars
+        self.max_entry_chars = max_entry_chars
+        self._entries: OrderedDict[tuple, str | None] = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key: tuple) -> str | None | object:
+        """Return the cached content for key, or CACHE_MISS."""
+        with self._lock:
+            content = self._entries.get(key, CACHE_MISS)
+            if content is not CACHE_MISS:
+                self._entries.move_to_end(key)
+            return content
+    
+    def put(self, key: tuple, content: str | None) -> None:
+        """Cache content for key unless it exceeds the per-entry limit."""
+        size = len(content) if content else 0
+        if size > self.max_entry_chars:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            while self._entries and self._total_chars + size > self.max_total_chars:
+                _, oldest = self._entries.popitem(last=False)
+                self._total_chars -= len(oldest) if oldest else 0
+            self._entries[key] = content
+            self._total_chars += size
+    
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        with self._lock:
+            self._entries.clear()
+            self._total_chars = 0
+
+
+_FILE_CONTENT_CACHE = FileContentCache(FILE_CACHE_MAX_TOTAL_CHARS, FILE_CACHE_MAX_ENTRY_CHARS)
+
+ADDED_CHANGE_TYPES = ("add",)
+DELETED_CHANGE_TYPES = ("delete", "delete, sourceRename")
+
+# Assets and minified bundles are never useful to review and can be huge.
+# SVG is deliberately absent: it is XML that can carry scripts and links.
+UNREVIEWABLE_SUFFIXES = (
+    ".png", ".jpg", ".jpeg", ".gif", ".ico", ".webp", ".bmp",
+    ".pdf", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".zip", ".jar", ".gz", ".class",
+    ".min.js", ".min.css",
+)
+# Tool-generated files: big, noisy diffs with nothing to review by hand
+GENERATED_SUFFIXES = (".lock", ".snap", ".js.map", ".css.map")
+GENERATED_FILE_NAMES = frozenset({
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml",
+    "poetry.lock", "pipfile.lock", "composer.lock", "gemfile.lock", "cargo.lock",
+})
+MAX_REVIEW_FILE_CHARS = 256 * 1024  # Larger files are assumed generated and not reviewed
+
+
+def get_path_skip_reason(path: str, item: dict) -> str | None:
+    """Return why a changed file should not be downloaded, or None to review it."""
+    if item.get("contentMetadata", {}).get("isBinary"):
+        return "binary file"
+    lower_path = path.lower()
+    if lower_path.endswith(UNREVIEWABLE_SUFFIXES):
+        return "binary or minified asset"
+    if lower_path.endswith(GENERATED_SUFFIXES) or lower_path.rpartition("/")[2] in GENERATED_FILE_NAMES:
+        return "generated file"
+    return None
+
+
+def get_content_skip_reason(*contents: str | None) -> str | None:
+    """Return why downloaded file contents should not be prompted, or None."""
+    for content in contents:
+        if content is None:
+            continue
+        if "\x00" in content:
+            return "binary file"
+        if len(content) > MAX_REVIEW_FILE_CHARS:
+            return f"large file, over {MAX_REVIEW_FILE_CHARS} chars"
+    return None
+
+
+FILE_STREAM_CHUNK_BYTES = 64 * 1024  # Read size when streaming file contents
+# Retry throttling and transient server errors, honoring Retry-After. POST is
+# left out because re-sending a comment thread could post it twice. The last
+# response is returned (not raised) so raise_for_status stays the final gate.
+ADO_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "PUT"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+HTTP_POOL_MAXSIZE = 32  # Pooled connections to dev.azure.com per client
+PR_CHANGES_PAGE_SIZE = 2000  # Iteration changes API maximum for $top
+MAX_FETCH_WORKERS = 16  # Concurrent file fetches per client (must not exceed HTTP_POOL_MAXSIZE)
+
+
+class PRNotReadyError(Exception):
+    """The PR has no merge commits to diff yet, so it cannot be reviewed now."""
+
+
 class AzureDevOpsClient:
     """Simple client for Azure DevOps REST API."""
     
@@ -125,7 +261,19 @@ class AzureDevOpsClient:
         self.project = project
         self.base_url = f"https://dev.azure.com/{org}/{project}/_apis"
         self.repo = repo
-        self.auth = ("", pat)  # Basic auth with empty username
+        self._repo_path = f"/git/repositories/{repo}"
+        self._items_url = f"{self.base_url}{self._repo_path}/items"  # Hit once per file version
+        # One keep-alive session so every call after the first skips the TCP+TLS handshake
+        self._session = requests.Session()
+        self._session.auth = ("", pat)  # Basic auth with empty username
+        self._session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=ADO_RETRY),
+        )
+        # Shared across clients so warm instances reuse blobs from earlier invocations
+        self._content_cache = _FILE_CONTENT_CACHE
+        # Long-lived pool for concurrent fetches; workers share the session's connections
+        self._executor = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS, thread_name_prefix="ado-fetch")
     
     def _request(self, method: str, endpoint: str, data: dict = None, extra_params: dict = None) -> dict:
         """Make HTTP request to Azure DevOps API with timing.
@@ -144,26 +292,41 @@ class AzureDevOpsClient:
         params["api-version"] = self.API_VERSION
         headers = {"Content-Type": "application/json"} if method in ("POST", "PUT") else None
         
-        logger.info(f"[ADO {method}] {endpoint}")
+        logger.info("[ADO %s] %s", method, endpoint)
         if data:
-            logger.debug(f"[ADO {method}] Payload keys: {list(data.keys())}")
+            logger.debug("[ADO %s] Payload keys: %s", method, list(data.keys()))
+        
+        # Compact orjson bytes instead of requests' json= (stdlib, with spaces);
+        # review comments embed whole markdown reviews
+        body = orjson.dumps(data) if data is not None else None
         
         start_time = time.time()
         try:
-            response = requests.request(
-                method, url, auth=self.auth, params=params, headers=headers, json=data
+            response = self._session.request(
+                method, url, params=params, headers=headers, data=body
             )
             elapsed = (time.time() - start_time) * 1000
             
-            logger.info(f"[ADO {method}] {endpoint} | Status: {response.status_code} | {elapsed:.0f}ms")
+            logger.info("[ADO %s] %s | Status: %s | %.0fms", method, endpoint, response.status_code, elapsed)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except requests.HTTPError as e:
             elapsed = (time.time() - start_time) * 1000
-            logger.error(f"[ADO {method}] {endpoint} | FAILED | Status: {e.response.status_code} | {elapsed:.0f}ms")
-            logger.error(f"[ADO {method}] Error response: {e.response.text[:500]}")
+            logger.error("[ADO %s] %s | FAILED | Status: %s | %.0fms", method, endpoint, e.response.status_code, elapsed)
+            logger.error("[ADO %s] Error response: %s", method, e.response.text[:500])
             raise
     
+    def close(self) -> None:
+        """Stop the fetch pool and close the HTTP session and its pooled connections."""
+        self._executor.shutdown()
+        self._session.close()
+    
+    def __enter__(self) -> "AzureDevOpsClient":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+    
     def _get(self, endpoint: str, params: dict = None) -> dict:
         """Make GET request to Azure DevOps API."""
         return self._request("GET", endpoint, extra_params=params)
@@ -178,11 +341,11 @@ class AzureDevOpsClient:
     
     def get_pull_request(self, pr_id: int) -> dict:
         """Fetch PR metadata."""
-        return self._get(f"/git/repositories/{self.repo}/pullrequests/{pr_id}")
+        return self._get(f"{self._repo_path}/pullrequests/{pr_id}")
     
     def get_pr_iterations(self, pr_id: int) -> list:
         """Get PR iterations (each push creates a new iteration)."""
-        result = self._get(f"/git/repositories/{self.repo}/pullrequests/{pr_id}/iterations")
+        result = self._get(f"{self._repo_path}/pullrequests/{pr_id}/iterations")
         return result.get("value", [])
     
     def get_pr_changes(self, pr_id: int, iteration_id: int = None) -> list:
@@ -193,14 +356,34 @@ class AzureDevOpsClient:
                 return []
             iteration_id = iterations[-1]["id"]  # Latest iteration
         
-        result = self._get(
-            f"/git/repositories/{self.repo}/pullrequests/{pr_id}/iterations/{iteration_id}/changes"
-        )
-        return result.get("changeEntries", [])
-    
-    def get_file_content(self, path: str, commit_id: str) -> str:
-        """Fetch file content at a specific commit."""
-        url = f"{self.base_url}/git/repositories/{self.repo}/items"
+        # Page at the API maximum so typical PRs list in one call; the service
+        # returns nextSkipId while more change entries remain
+        endpoint = f"{self._repo_path}/pullrequests/{pr_id}/iterations/{iteration_id}/changes"
+        changes = []
+        skip = 0
+        while True:
+            result = self._get(endpoint, params={"$top": PR_CHANGES_PAGE_SIZE, "$skip": skip})
+            changes.extend(result.get("changeEntries", []))
+            skip = result.get("nextSkipId") or 0
+            if not skip:
+                return changes
+    
+    def get_file_content(self, path: str, commit_id: str, max_chars: int = MAX_REVIEW_FILE_CHARS) -> str:
+        """Fetch file content at a specific commit.
+        
+        Results (including "not found") are memoized per repository, path
+        and commit in the process-wide file content cache. The body is
+        streamed and reading stops once it passes max_chars, so a file
+        that is too large to review is returned cut off just past the
+        limit (and not cached) instead of being downloaded in full.
+        """
+        cache_key = (self.base_url, self.repo, path, commit_id)
+        cached = self._content_cache.get(cache_key)
+        if cached is not CACHE_MISS:
+            logger.debug("[ADO FILE] Cache hit: %s @ %s", path, commit_id[:8])
+            return cached
+        
+        url = self._items_url
         params = {
             "path": path,
             "versionDescriptor.version": commit_id,
@@ -208,59 +391,152 @@ class AzureDevOpsClient:
             "api-version": self.API_VERSION,
         }
         
-        logger.debug(f"[ADO FILE] Fetching: {path} @ {commit_id[:8]}")
+        logger.debug("[ADO FILE] Fetching: %s @ %s", path, commit_id[:8])
         
         with timed_operation() as elapsed:
             try:
-                response = requests.get(url, auth=self.auth, params=params)
-                response.raise_for_status()
-                logger.debug(f"[ADO FILE] {path} | {len(response.text)} bytes | {elapsed():.0f}ms")
-                return response.text
+                with self._session.get(url, params=params, stream=True) as response:
+                    response.raise_for_status()
+                    content = self._read_text(response, max_chars)
+                logger.debug("[ADO FILE] %s | %s chars | %.0fms", path, len(content), elapsed())
+                if len(content) <= max_chars:
+                    self._content_cache.put(cache_key, content)
+                return content
             except requests.HTTPError as e:
-                logger.debug(f"[ADO FILE] {path} | Not found (status {e.response.status_code}) | {elapsed():.0f}ms")
+                logger.debug("[ADO FILE] %s | Not found (status %s) | %.0fms", path, e.response.status_code, elapsed())
+                # Only a 404 is a stable answer; other errors may succeed on the next call
+                if e.response.status_code == 404:
+                    self._content_cache.put(cache_key, None)
                 return None  # File might not exist in this version
     
-    def get_pr_diff(self, pr_id: int) -> list:
+    @staticmethod
+    def _read_text(response: requests.Response, max_chars: int) -> str:
+        """Decode a streamed response body, stopping once it exceeds max_chars."""
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        buf = io.StringIO()
+        size = 0
+        for chunk in response.iter_content(chunk_size=FILE_STREAM_CHUNK_BYTES):
+            size += buf.write(decoder.decode(chunk))
+            if size > max_chars:
+                return buf.getvalue()
+        buf.write(decoder.decode(b"", final=True))
+        return buf.getvalue()
+    
+    def _submit_fetches(self, change: dict, source_commit: str, target_commit: str) -> tuple | None:
+        """Start the content fetches one change entry needs, or return None for folders.
+        
+        Returns:
+            (path, change_type, skip_reason, source_future, target_future); a
+            future is None when that side is not fetched
+        """
+        item = change.get("item", {})
+        path = item.get("path", "")
+        change_type = change.get("changeType", "unknown")
+        
+        # Skip folders
+        if item.get("isFolder"):
+            logger.debug("[ADO] Skipping folder: %s", path)
+            return None
+        
+        source_future = target_future = None
+        skip_reason = get_path_skip_reason(path, item)
+        if not skip_reason:
+            # An added file has no target version and a deleted one no source
+            # version, so skip the guaranteed-404 fetch
+            if change_type not in DELETED_CHANGE_TYPES:
+                # New version (PR branch)
+                source_future = self._executor.submit(self.get_file_content, path, source_commit)
+            if change_type not in ADDED_CHANGE_TYPES:
+                # Old version (target branch)
+                target_future = self._executor.submit(self.get_file_content, path, target_commit)
+        return path, change_type, skip_reason, source_future, target_future
+    
+    @staticmethod
+    def _collect_diff(path: str, change_type: str, skip_reason: str | None,
+                      source_future, target_future) -> dict:
+        """Wait for a change entry's fetches and build its diff entry."""
+        source_content = source_future.result() if source_future else None
+        target_content = target_future.result() if target_future else None
+        if not skip_reason:
+            skip_reason = get_content_skip_reason(source_content, target_content)
+        if skip_reason:
+            logger.info("[ADO] Not reviewing %s (%s)", path, skip_reason)
+            source_content = target_content = None
+        
+        return {
+            "path": path,
+            "change_type": change_type,
+            "source_content": source_content,
+            "target_content": target_content,
+            "skip_reason": skip_reason,
+        }
+    
+    def get_pull_request_with_changes(self, pr_id: int) -> tuple[dict, list]:
+        """Fetch PR metadata and the latest iteration's change list concurrently.
+        
+        The two are independent, so the iterations and changes calls overlap
+        the metadata round-trip. Pass both on to get_pr_diff.
+        
+        Returns:
+            (PR metadata dict, change entries)
+        """
+        changes_future = self._executor.submit(self.get_pr_changes, pr_id)
+        try:
+            pr = self.get_pull_request(pr_id)
+        except Exception:
+            changes_future.cancel()
+            raise
+        return pr, changes_future.result()
+    
+    def get_pr_diff(self, pr_id: int, pr: dict = None, changes: list = None) -> list:
         """
         Get full diff for a PR with file contents from both source and target.
-        Returns list of dicts with path, change_type, source_content, target_content.
+        Returns list of dicts with path, change_type, source_content, target_content
+        and skip_reason (set, with both contents None, for files not worth reviewing).
+        
+        Pass the PR metadata and change entries the caller already fetched as
+        ``pr`` and ``changes`` (see get_pull_request_with_changes) to skip
+        repeating those round-trips.
+        
+        Raises:
+            PRNotReadyError: If the PR has no source/target merge commits yet.
+                Checked before any file fetches (and before listing changes
+                when they were not passed in).
         """
-        logger.info(f"[ADO] Fetching full diff for PR #{pr_id}")
+        logger.info("[ADO] Fetching full diff for PR #%s", pr_id)
         
         with timed_operation() as elapsed:
-            pr = self.get_pull_request(pr_id)
-            source_commit = pr["lastMergeSourceCommit"]["commitId"]
-            target_commit = pr["lastMergeTargetCommit"]["commitId"]
-            logger.info(f"[ADO] PR commits: source={source_commit[:8]} target={target_commit[:8]}")
+            changes_future = None
+            if pr is None:
+                if changes is None:
+                    # PR metadata and the change list are independent - fetch them together
+                    changes_future = self._executor.submit(self.get_pr_changes, pr_id)
+                pr = self.get_pull_request(pr_id)
             
-            changes = self.get_pr_changes(pr_id)
-            logger.info(f"[ADO] Found {len(changes)} changed items in PR")
+            source_commit = pr.get("lastMergeSourceCommit", {}).get("commitId")
+            target_commit = pr.get("lastMergeTargetCommit", {}).get("commitId")
+            if not source_commit or not target_commit:
+                if changes_future:
+                    changes_future.cancel()
+                raise PRNotReadyError(
+                    f"PR #{pr_id} has no merge commits yet (merge still being computed, "
+                    f"conflicts, or empty source branch)"
+                )
+            logger.info("[ADO] PR commits: source=%s target=%s", source_commit[:8], target_commit[:8])
             
-            file_diffs = []
-            files_processed = 0
-            for change in changes:
-                item = change.get("item", {})
-                path = item.get("path", "")
-                change_type = change.get("changeType", "unknown")
-                
-                # Skip folders
-                if item.get("isFolder"):
-                    logger.debug(f"[ADO] Skipping folder: {path}")
-                    continue
-                
-                # Get content from both versions
-                source_content = self.get_file_content(path, source_commit)
-                target_content = self.get_file_content(path, target_commit)
-                
-                file_diffs.append({
-                    "path": path,
-                    "change_type": change_type,
-                    "source_content": source_content,  # New version (PR branch)
-                    "target_content": target_content,  # Old version (target branch)
-                })
-                files_processed += 1
+            if changes is None:
+                changes = changes_future.result() if changes_future else self.get_pr_changes(pr_id)
+            logger.info("[ADO] Found %s changed items in PR", len(changes))
             
-            logger.info(f"[ADO] Diff complete: {files_processed} files | {elapsed():.0f}ms total")
+            # Start every source and target fetch up front so both sides of all
+            # files share the session pool; wall clock tracks the slowest
+            # fetches rather than two round-trips per file. Collecting in
+            # submission order keeps the results in change order.
+            pending = [self._submit_fetches(change, source_commit, target_commit) for change in changes]
+            file_diffs = [self._collect_diff(*entry) for entry in pending if entry is not None]
+            files_processed = len(file_diffs)
+            
+            logger.info("[ADO] Diff complete: %s files | %.0fms total", files_processed, elapsed())
             
             return file_diffs
     
@@ -284,7 +560,7 @@ class AzureDevOpsClient:
             ],
             "status": 1,  # Active
         }
-        return self._post(f"/git/repositories/{self.repo}/pullrequests/{pr_id}/threads", data)
+        return self._post(f"{self._repo_path}/pullrequests/{pr_id}/threads", data)
     
     def reject_pr(self, pr_id: int, reviewer_id: str) -> dict:
         """Reject a PR by voting -10 (reject).
@@ -299,7 +575,7 @@ class AzureDevOpsClient:
         # Vote values: 10=approved, 5=approved with suggestions, 0=no vote, -5=waiting, -10=rejected
         data = {"vote": -10}
         return self._put(
-            f"/git/repositories/{self.repo}/pullrequests/{pr_id}/reviewers/{reviewer_id}",
+            f"{self._repo_path}/pullrequests/{pr_id}/reviewers/{reviewer_id}",
             data
         )
     
@@ -317,24 +593,92 @@ class AzureDevOpsClient:
         
         with timed_operation() as elapsed:
             try:
-                response = requests.get(url, auth=self.auth, params=params)
+                response = self._session.get(url, params=params)
                 response.raise_for_status()
-                data = response.json()
+                data = orjson.loads(response.content)
                 
                 user_id = data["authenticatedUser"]["id"]
                 user_name = data["authenticatedUser"].get("providerDisplayName", "unknown")
-                logger.info(f"[ADO] Current user: {user_name} (id={user_id[:8]}...) | {elapsed():.0f}ms")
+                logger.info("[ADO] Current user: %s (id=%s...) | %.0fms", user_name, user_id[:8], elapsed())
                 
                 return user_id
             except requests.HTTPError as e:
-                logger.error(f"[ADO] Failed to get user identity | Status: {e.response.status_code} | {elapsed():.0f}ms")
+                logger.error("[ADO] Failed to get user identity | Status: %s | %.0fms", e.response.status_code, elapsed())
                 raise
 
 
+# (org, project, repo) -> (PAT the client was built with, client)
+_ADO_CLIENTS: dict[tuple[str, str, str], tuple[str, AzureDevOpsClient]] = {}
+_ADO_CLIENTS_LOCK = threading.Lock()  # review_pr serves concurrent requests
+
+
+def _get_ado_client(config: dict) -> AzureDevOpsClient:
+    """Return the shared client for the configured org/project/repo.
+    
+    Warm instances keep the client (and its pooled connections and fetch
+    threads) across invocations, so it is not closed after each request.
+    A rotated PAT replaces the cached client. The old one is not closed,
+    because requests already running may still be using it; it is released
+    (executor threads included) once the last of them drops its reference.
+    
+    Args:
+        config: Configuration dictionary with the AZURE_DEVOPS_* settings
+        
+    Returns:
+        Cached AzureDevOpsClient
+    """
+    key = (
+        config["AZURE_DEVOPS_ORG"],
+        config["AZURE_DEVOPS_PROJECT"],
+        config["AZURE_DEVOPS_REPO"],
+    )
+    pat = config["AZURE_DEVOPS_PAT"]
+    with _ADO_CLIENTS_LOCK:
+        cached = _ADO_CLIENTS.get(key)
+        if cached is not None and cached[0] == pat:
+            return cached[1]
+        if cached is not None:
+            logger.info("[ADO] PAT changed for %s/%s/%s - replacing cached client", *key)
+        client = AzureDevOpsClient(org=key[0], project=key[1], repo=key[2], pat=pat)
+        _ADO_CLIENTS[key] = (pat, client)
+        return client
+
+
 # =============================================================================
 # Cloud Storage
 # =============================================================================
 
+GCS_TIMEOUT_SECONDS = 30  # Per-request timeout for GCS uploads
+
+# Reused across warm invocations to skip credential and session setup
+_GCS_CLIENT: storage.Client | None = None
+_GCS_BUCKETS: dict[str, storage.Bucket] = {}
+
+
+def _get_storage_client() -> storage.Client:
+    """Return the shared Cloud Storage client, creating it on first use."""
+    global _GCS_CLIENT
+    if _GCS_CLIENT is None:
+        _GCS_CLIENT = storage.Client()
+    return _GCS_CLIENT
+
+
+def _get_bucket(bucket_name: str) -> storage.Bucket:
+    """Return a cached bucket handle for the shared storage client.
+    
+    Args:
+        bucket_name: GCS bucket name
+        
+    Returns:
+        Bucket handle (no API call is made to create it)
+    """
+    bucket = _GCS_BUCKETS.get(bucket_name)
+    if bucket is None:
+        bucket = _get_storage_client().bucket(bucket_name)
+        _GCS_BUCKETS[bucket_name] = bucket
+    return bucket
+
+
 def save_to_storage(bucket_name: str, pr_id: int, review: str) -> str:
     """Save review to Cloud Storage with date partitioning.
     
@@ -346,30 +690,37 @@ def save_to_storage(bucket_name: str, pr_id: int, review: str) -> str:
     Returns:
         Full GCS path (gs://bucket/path)
     """
-    logger.info(f"[GCS] Saving review for PR #{pr_id} to bucket: {bucket_name}")
-    logger.debug(f"[GCS] Review content size: {len(review)} chars")
+    logger.info("[GCS] Saving review for PR #%s to bucket: %s", pr_id, bucket_name)
+    logger.debug("[GCS] Review content size: %s chars", len(review))
     
     with timed_operation() as elapsed:
         try:
-            client = storage.Client()
-            bucket = client.bucket(bucket_name)
-            
-            # Date partitioning: yyyy/mm/dd
-            now = datetime.now(timezone.utc)
-            date_path = now.strftime("%Y/%m/%d")
-            timestamp = now.strftime("%H%M%S")
+            bucket = _get_bucket(bucket_name)
             
-            blob_path = f"reviews/{date_path}/pr-{pr_id}-{timestamp}-review.md"
+            # Date partitioning: reviews/yyyy/mm/dd/pr-<id>-<hhmmss>-<usec>-review.md,
+            # formatted from a single timestamp in one strftime pass. Microseconds
+            # keep two reviews of one PR in the same second from colliding on the
+            # create-only upload below.
+            blob_path = datetime.now(timezone.utc).strftime(f"reviews/%Y/%m/%d/pr-{pr_id}-%H%M%S-%f-review.md")
             blob = bucket.blob(blob_path)
             
-            blob.upload_from_string(review, content_type="text/markdown")
+            # Markdown compresses well; GCS serves it decompressed to clients
+            # that don't send Accept-Encoding: gzip (decompressive transcoding)
+            review_bytes = gzip.compress(review.encode("utf-8"), compresslevel=6)
+            blob.content_encoding = "gzip"
+            blob.upload_from_string(
+                review_bytes,
+                content_type="text/markdown; charset=utf-8",
+                if_generation_match=0,  # Never overwrite an existing review
+                timeout=GCS_TIMEOUT_SECONDS,
+            )
             
             full_path = f"gs://{bucket_name}/{blob_path}"
-            logger.info(f"[GCS] Upload complete: {blob_path} | {len(review)} bytes | {elapsed():.0f}ms")
+            logger.info("[GCS] Upload complete: %s | %s bytes gzipped | %.0fms", blob_path, len(review_bytes), elapsed())
             
             return full_path
         except Exception as e:
-            logger.error(f"[GCS] Upload FAILED | {elapsed():.0f}ms | Error: {str(e)}")
+            logger.error("[GCS] Upload FAILED | %.0fms | Error: %s", elapsed(), e)
             raise
 
 
@@ -379,6 +730,74 @@ def save_to_storage(bucket_name: str, pr_id: int, review: str) -> str:
 
 MAX_RETRY_ATTEMPTS = 3  # Maximum number of retry attempts before giving up
 
+TERMINAL_MARKER_STATUSES = frozenset({"completed", "failed"})  # Never reprocessed
+MARKER_CAS_ATTEMPTS = 3  # Conditional marker updates retried on concurrent modification
+MAX_MARKER_ERROR_CHARS = 500  # Error text kept in a marker; str slicing copies only this much
+
+# Completed markers never change, so a warm instance can skip the GCS read for
+# PR commits it has already seen finish. Failed markers are not cached: the
+# DLQ reprocessor (a separate function) deletes them to allow another attempt.
+COMPLETED_MARKER_CACHE_MAX_ENTRIES = 4096
+
+_COMPLETED_MARKERS: OrderedDict[tuple[str, int, str], None] = OrderedDict()
+_COMPLETED_MARKERS_LOCK = threading.Lock()  # review_pr serves concurrent requests
+
+
+def _is_completed_cached(bucket_name: str, pr_id: int, commit_sha: str) -> bool:
+    """Return True (and refresh the LRU position) if the commit is cached as completed."""
+    key = (bucket_name, pr_id, commit_sha)
+    with _COMPLETED_MARKERS_LOCK:
+        if key not in _COMPLETED_MARKERS:
+            return False
+        _COMPLETED_MARKERS.move_to_end(key)
+        return True
+
+
+def _remember_completed(bucket_name: str, pr_id: int, commit_sha: str) -> None:
+    """Record a completed marker in the in-process LRU cache."""
+    key = (bucket_name, pr_id, commit_sha)
+    with _COMPLETED_MARKERS_LOCK:
+        _COMPLETED_MARKERS[key] = None
+        _COMPLETED_MARKERS.move_to_end(key)
+        while len(_COMPLETED_MARKERS) > COMPLETED_MARKER_CACHE_MAX_ENTRIES:
+            _COMPLETED_MARKERS.popitem(last=False)
+
+
+class MarkerDict(TypedDict, total=False):
+    """Shape of an idempotency marker blob. Which keys are present depends on status."""
+    pr_id: int
+    commit_sha: str
+    status: str  # "processing" | "completed" | "failed"
+    retry_count: int
+    claimed_at: str
+    last_attempt_at: str
+    last_error: str
+    processed_at: str
+    max_severity: str
+    commented: bool
+    failed_at: str
+    error: str
+    reason: str
+
+
+def _read_marker(blob: storage.Blob) -> tuple[MarkerDict | None, int]:
+    """Download a marker and its generation in a single GET.
+    
+    Args:
+        blob: Marker blob handle
+        
+    Returns:
+        (marker, generation). (None, 0) if the marker does not exist, so the
+        generation can be passed straight to if_generation_match for a
+        create-only write. Raises orjson.JSONDecodeError (a json.JSONDecodeError
+        subclass) on a corrupted marker, with blob.generation set from the download.
+    """
+    try:
+        data = blob.download_as_bytes(timeout=GCS_TIMEOUT_SECONDS)
+    except NotFound:
+        return None, 0
+    return orjson.loads(data), blob.generation
+
 
 def check_and_claim_processing(bucket_name: str, pr_id: int, commit_sha: str) -> bool:
     """
@@ -399,46 +818,48 @@ def check_and_claim_processing(bucket_name: str, pr_id: int, commit_sha: str) ->
         True if we should process (we claimed it or it's a valid retry)
         False if already completed, failed permanently, or claimed by another instance
     """
-    logger.info(f"[IDEMPOTENCY] Checking marker for PR #{pr_id} @ {commit_sha[:8]}")
+    logger.info("[IDEMPOTENCY] Checking marker for PR #%s @ %s", pr_id, commit_sha[:8])
+    
+    if _is_completed_cached(bucket_name, pr_id, commit_sha):
+        logger.info("[IDEMPOTENCY] PR #%s @ %s already completed (cached) - SKIPPING", pr_id, commit_sha[:8])
+        return False
     
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
+    bucket = _get_bucket(bucket_name)
     blob = bucket.blob(f"idempotency/pr-{pr_id}-{commit_sha}.json")
     
-    # Check if marker exists
-    if blob.exists():
-        # Read existing marker to check status
-        try:
-            marker_data = json.loads(blob.download_as_text())
+    # One GET returns the marker (if any) and its generation
+    generation = 0
+    try:
+        marker_data, generation = _read_marker(blob)
+        if marker_data is not None:
             status = marker_data.get("status", "unknown")
             retry_count = marker_data.get("retry_count", 0)
             
-            if status == "completed":
-                logger.info(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} already completed - SKIPPING")
-                return False
-            
-            if status == "failed":
-                logger.info(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} permanently failed after {retry_count} attempts - SKIPPING")
+            if status in TERMINAL_MARKER_STATUSES:
+                logger.info("[IDEMPOTENCY] PR #%s @ %s already %s (retries: %s) - SKIPPING", pr_id, commit_sha[:8], status, retry_count)
+                if status == "completed":
+                    _remember_completed(bucket_name, pr_id, commit_sha)
                 return False
             
             if status == "processing":
                 # This is a retry - check if we've exceeded max attempts
                 if retry_count >= MAX_RETRY_ATTEMPTS:
-                    logger.warning(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} exceeded max retries ({MAX_RETRY_ATTEMPTS}) - SKIPPING")
+                    logger.warning("[IDEMPOTENCY] PR #%s @ %s exceeded max retries (%s) - SKIPPING", pr_id, commit_sha[:8], MAX_RETRY_ATTEMPTS)
                     return False
-                logger.info(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} retry attempt {retry_count + 1}/{MAX_RETRY_ATTEMPTS}")
+                logger.info("[IDEMPOTENCY] PR #%s @ %s retry attempt %s/%s", pr_id, commit_sha[:8], retry_count + 1, MAX_RETRY_ATTEMPTS)
                 return True
-                
-        except json.JSONDecodeError:
-            logger.warning(f"[IDEMPOTENCY] Corrupted marker for PR #{pr_id} - allowing processing")
-            # Fall through to create new marker
-        except Exception as e:
-            logger.warning(f"[IDEMPOTENCY] Error reading marker: {e} - allowing processing")
-            return True  # Allow processing on read errors
+            
+    except json.JSONDecodeError:
+        logger.warning("[IDEMPOTENCY] Corrupted marker for PR #%s - allowing processing", pr_id)
+        generation = blob.generation or 0  # Replace the corrupted marker in place
+    except Exception as e:
+        logger.warning("[IDEMPOTENCY] Error reading marker: %s - allowing processing", e)
+        return True  # Allow processing on read errors
     
     # Try to claim it atomically
-    # if_generation_match=0 means "only succeed if file doesn't exist"
-    marker = {
+    # if_generation_match=0 means "only succeed if file doesn't exist"; a
+    # corrupted marker is only replaced if nobody rewrote it since we read it
+    marker: MarkerDict = {
         "pr_id": pr_id,
         "commit_sha": commit_sha,
         "claimed_at": datetime.now(timezone.utc).isoformat(),
@@ -448,14 +869,14 @@ def check_and_claim_processing(bucket_name: str, pr_id: int, commit_sha: str) ->
     
     try:
         blob.upload_from_string(
-            json.dumps(marker, indent=2),
+            orjson.dumps(marker, option=orjson.OPT_INDENT_2),
             content_type="application/json",
-            if_generation_match=0  # Atomic: fails if file exists
+            if_generation_match=generation  # Atomic: fails if the marker changed
         )
-        logger.info(f"[IDEMPOTENCY] Claimed processing for PR #{pr_id} @ {commit_sha[:8]}")
+        logger.info("[IDEMPOTENCY] Claimed processing for PR #%s @ %s", pr_id, commit_sha[:8])
         return True
     except PreconditionFailed:
-        logger.info(f"[IDEMPOTENCY] Race condition - another instance claimed PR #{pr_id} @ {commit_sha[:8]} - SKIPPING")
+        logger.info("[IDEMPOTENCY] Race condition - another instance claimed PR #%s @ %s - SKIPPING", pr_id, commit_sha[:8])
         return False
 
 
@@ -471,13 +892,12 @@ def update_marker_completed(bucket_name: str, pr_id: int, commit_sha: str,
         max_severity: The maximum severity found in the review
         commented: Whether a comment was posted to the PR
     """
-    logger.info(f"[IDEMPOTENCY] Updating marker for PR #{pr_id} @ {commit_sha[:8]} -> completed")
+    logger.info("[IDEMPOTENCY] Updating marker for PR #%s @ %s -> completed", pr_id, commit_sha[:8])
     
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
+    bucket = _get_bucket(bucket_name)
     blob = bucket.blob(f"idempotency/pr-{pr_id}-{commit_sha}.json")
     
-    marker = {
+    marker: MarkerDict = {
         "pr_id": pr_id,
         "commit_sha": commit_sha,
         "processed_at": datetime.now(timezone.utc).isoformat(),
@@ -487,10 +907,11 @@ def update_marker_completed(bucket_name: str, pr_id: int, commit_sha: str,
     }
     
     blob.upload_from_string(
-        json.dumps(marker, indent=2),
+        orjson.dumps(marker, option=orjson.OPT_INDENT_2),
         content_type="application/json"
     )
-    logger.info(f"[IDEMPOTENCY] Marker updated: severity={max_severity}, commented={commented}")
+    _remember_completed(bucket_name, pr_id, commit_sha)
+    logger.info("[IDEMPOTENCY] Marker updated: severity=%s, commented=%s", max_severity, commented)
 
 
 def update_marker_for_retry(bucket_name: str, pr_id: int, commit_sha: str, error_msg: str) -> bool:
@@ -508,56 +929,73 @@ def update_marker_for_retry(bucket_name: str, pr_id: int, commit_sha: str, error
     Returns:
         True if retry should be attempted (re-raise exception)
         False if max retries exceeded (acknowledge message to stop retries)
+        
+    Raises:
+        PreconditionFailed: If the marker kept changing for MARKER_CAS_ATTEMPTS writes
     """
-    logger.info(f"[IDEMPOTENCY] Updating marker for retry: PR #{pr_id} @ {commit_sha[:8]}")
+    logger.info("[IDEMPOTENCY] Updating marker for retry: PR #%s @ %s", pr_id, commit_sha[:8])
     
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
+    bucket = _get_bucket(bucket_name)
     blob = bucket.blob(f"idempotency/pr-{pr_id}-{commit_sha}.json")
     
-    # Read existing marker to get retry count
-    retry_count = 0
-    try:
-        if blob.exists():
-            marker_data = json.loads(blob.download_as_text())
-            retry_count = marker_data.get("retry_count", 0)
-    except Exception as e:
-        logger.warning(f"[IDEMPOTENCY] Error reading marker: {e}")
+    last_error = error_msg[:MAX_MARKER_ERROR_CHARS]  # Truncate long error messages once
     
-    # Increment retry count
-    retry_count += 1
+    # Read-modify-write conditional on the generation read; if another attempt
+    # updated the marker in between, re-read it and apply our increment on top
+    for attempt in range(1, MARKER_CAS_ATTEMPTS + 1):
+        # Read existing marker (and its generation) to get retry count
+        retry_count = 0
+        generation = None  # Unknown - write unconditionally
+        try:
+            marker_data, generation = _read_marker(blob)
+            if marker_data is not None:
+                retry_count = marker_data.get("retry_count", 0)
+        except Exception as e:
+            logger.warning("[IDEMPOTENCY] Error reading marker: %s", e)
+        
+        # Increment retry count
+        retry_count += 1
+        give_up = retry_count >= MAX_RETRY_ATTEMPTS
+        
+        if give_up:
+            # Max retries exceeded - mark as permanently failed
+            marker: MarkerDict = {
+                "pr_id": pr_id,
+                "commit_sha": commit_sha,
+                "status": "failed",
+                "retry_count": retry_count,
+                "failed_at": datetime.now(timezone.utc).isoformat(),
+                "last_error": last_error,
+            }
+        else:
+            # Update marker with incremented retry count
+            marker = {
+                "pr_id": pr_id,
+                "commit_sha": commit_sha,
+                "status": "processing",
+                "retry_count": retry_count,
+                "last_attempt_at": datetime.now(timezone.utc).isoformat(),
+                "last_error": last_error,
+            }
+        
+        try:
+            blob.upload_from_string(
+                orjson.dumps(marker, option=orjson.OPT_INDENT_2),
+                content_type="application/json",
+                if_generation_match=generation,  # Fails if another attempt updated it meanwhile
+            )
+        except PreconditionFailed:
+            if attempt == MARKER_CAS_ATTEMPTS:
+                raise
+            logger.warning("[IDEMPOTENCY] Marker for PR #%s changed concurrently - re-reading (attempt %s/%s)", pr_id, attempt, MARKER_CAS_ATTEMPTS)
+            continue
+        break
     
-    if retry_count >= MAX_RETRY_ATTEMPTS:
-        # Max retries exceeded - mark as permanently failed
-        marker = {
-            "pr_id": pr_id,
-            "commit_sha": commit_sha,
-            "status": "failed",
-            "retry_count": retry_count,
-            "failed_at": datetime.now(timezone.utc).isoformat(),
-            "last_error": error_msg[:500]  # Truncate long error messages
-        }
-        blob.upload_from_string(
-            json.dumps(marker, indent=2),
-            content_type="application/json"
-        )
-        logger.error(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} marked as FAILED after {retry_count} attempts")
+    if give_up:
+        logger.error("[IDEMPOTENCY] PR #%s @ %s marked as FAILED after %s attempts", pr_id, commit_sha[:8], retry_count)
         return False  # Don't retry - acknowledge message
     
-    # Update marker with incremented retry count
-    marker = {
-        "pr_id": pr_id,
-        "commit_sha": commit_sha,
-        "status": "processing",
-        "retry_count": retry_count,
-        "last_attempt_at": datetime.now(timezone.utc).isoformat(),
-        "last_error": error_msg[:500]
-    }
-    blob.upload_from_string(
-        json.dumps(marker, indent=2),
-        content_type="application/json"
-    )
-    logger.info(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} retry count: {retry_count}/{MAX_RETRY_ATTEMPTS}")
+    logger.info("[IDEMPOTENCY] PR #%s @ %s retry count: %s/%s", pr_id, commit_sha[:8], retry_count, MAX_RETRY_ATTEMPTS)
     return True  # Retry - re-raise exception
 
 
@@ -573,32 +1011,105 @@ def update_marker_failed(bucket_name: str, pr_id: int, commit_sha: str, error_ms
         commit_sha: The commit SHA
         error_msg: Error message describing the failure
     """
-    logger.info(f"[IDEMPOTENCY] Marking PR #{pr_id} @ {commit_sha[:8]} as permanently FAILED")
+    logger.info("[IDEMPOTENCY] Marking PR #%s @ %s as permanently FAILED", pr_id, commit_sha[:8])
     
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
+    bucket = _get_bucket(bucket_name)
     blob = bucket.blob(f"idempotency/pr-{pr_id}-{commit_sha}.json")
     
-    marker = {
+    marker: MarkerDict = {
         "pr_id": pr_id,
         "commit_sha": commit_sha,
         "status": "failed",
         "failed_at": datetime.now(timezone.utc).isoformat(),
-        "error": error_msg[:500],
+        "error": error_msg[:MAX_MARKER_ERROR_CHARS],
         "reason": "non_retryable_error"
     }
     
     blob.upload_from_string(
-        json.dumps(marker, indent=2),
+        orjson.dumps(marker, option=orjson.OPT_INDENT_2),
         content_type="application/json"
     )
-    logger.error(f"[IDEMPOTENCY] PR #{pr_id} @ {commit_sha[:8]} marked as FAILED (non-retryable)")
+    logger.error("[IDEMPOTENCY] PR #%s @ %s marked as FAILED (non-retryable)", pr_id, commit_sha[:8])
+
+
+GCS_BATCH_MAX_CALLS = 100  # Cloud Storage JSON API limit per batch request
+
+
+def _delete_markers(blobs: list[storage.Blob], failures: list[tuple[str, int]]) -> None:
+    """Delete markers one request each, recording (name, status) for non-404 failures."""
+    for blob in blobs:
+        try:
+            blob.delete(timeout=GCS_TIMEOUT_SECONDS)
+        except NotFound:
+            pass  # Marker already gone
+        except exceptions.GoogleAPICallError as e:
+            failures.append((blob.name, e.code))
+
+
+def reset_markers(bucket_name: str, items: list[tuple[int, str]]) -> None:
+    """Delete the idempotency markers for several PR commits at once.
+    
+    Deletes are grouped into Cloud Storage batch requests (up to
+    GCS_BATCH_MAX_CALLS per HTTP call) instead of one round-trip each.
+    A batch only reports one of its failed deletes, so a batch that fails
+    is redone one blob at a time to find every marker that really failed.
+    Markers that don't exist are ignored.
+    
+    Raises:
+        google.api_core.exceptions.GoogleAPICallError: If any delete failed
+            with something other than 404, after every batch has been sent
+    
+    Args:
+        bucket_name: GCS bucket name
+        items: (pr_id, commit_sha) pairs whose markers should be removed
+    """
+    if not items:
+        return
+    
+    with _COMPLETED_MARKERS_LOCK:
+        for pr_id, commit_sha in items:
+            _COMPLETED_MARKERS.pop((bucket_name, pr_id, commit_sha), None)
+    
+    bucket = _get_bucket(bucket_name)
+    blobs = [bucket.blob(f"idempotency/pr-{pr_id}-{commit_sha}.json") for pr_id, commit_sha in items]
+    
+    with timed_operation() as elapsed:
+        failures = []
+        if len(blobs) == 1:
+            _delete_markers(blobs, failures)
+        else:
+            client = _get_storage_client()
+            for start in range(0, len(blobs), GCS_BATCH_MAX_CALLS):
+                chunk = blobs[start:start + GCS_BATCH_MAX_CALLS]
+                try:
+                    with client.batch():
+                        for blob in chunk:
+                            blob.delete(timeout=GCS_TIMEOUT_SECONDS)
+                except exceptions.GoogleAPICallError as e:
+                    # Deletes that succeeded now 404 and are skipped; the rest are retried
+                    logger.warning("[IDEMPOTENCY] Batch delete failed (%s) - retrying %s markers one at a time", e.code, len(chunk))
+                    _delete_markers(chunk, failures)
+        
+        if failures:
+            logger.error("[IDEMPOTENCY] Failed to delete %s of %s markers: %s", len(failures), len(blobs), failures)
+            raise exceptions.from_http_status(
+                failures[0][1], f"Failed to delete {len(failures)} idempotency markers: {failures}"
+            )
+        
+        logger.info("[IDEMPOTENCY] Reset %s markers | %.0fms", len(blobs), elapsed())
 
 
 # =============================================================================
 # Severity Detection
 # =============================================================================
 
+# One pass over the review finds every priority label
+PRIORITY_PATTERN = re.compile(
+    r"\*\*Priority:\*\*[ \t]*(action-required|review-recommended|note)\b", re.IGNORECASE
+)
+PRIORITY_RANK = {"action-required": 3, "review-recommended": 2, "note": 1}
+
+
 def get_max_severity(review: str) -> str:
     """Determine the highest priority found in the review.
     
@@ -608,11 +1119,14 @@ def get_max_severity(review: str) -> str:
     Returns:
         One of: "action-required", "review-recommended", "note"
     """
-    if "**Priority:** action-required" in review:
-        return "action-required"
-    elif "**Priority:** review-recommended" in review:
-        return "review-recommended"
-    return "note"
+    max_severity = "note"
+    for match in PRIORITY_PATTERN.finditer(review):
+        severity = match.group(1).lower()
+        if severity == "action-required":
+            return severity  # Highest priority - nothing later can outrank it
+        if PRIORITY_RANK[severity] > PRIORITY_RANK[max_severity]:
+            max_severity = severity
+    return max_severity
 
 
 # =============================================================================
@@ -738,102 +1252,325 @@ When the PR is solid overall, acknowledge the author's effort. These findings ar
 """
 
 
+DIFF_CONTEXT_LINES = 3  # Unchanged lines kept around each hunk
+
+
+def build_unified_diff(path: str, target_content: str, source_content: str,
+                       context_lines: int = DIFF_CONTEXT_LINES) -> str:
+    """Build a unified diff from the target (old) to the source (new) version.
+    
+    Args:
+        path: File path, used for the diff header
+        target_content: File content on the target branch (old)
+        source_content: File content on the PR branch (new)
+        context_lines: Unchanged lines to keep around each hunk
+        
+    Returns:
+        Unified diff text, or an empty string if the contents are identical
+    """
+    return "\n".join(difflib.unified_diff(
+        target_content.splitlines(),
+        source_content.splitlines(),
+        fromfile=f"a{path}",
+        tofile=f"b{path}",
+        n=context_lines,
+        lineterm="",
+    ))
+
+
+DOCS_ONLY_SUFFIXES = (".md", ".txt", ".gitignore")  # Changes here alone don't warrant a review
+
+
+def is_whitespace_only(diff: dict) -> bool:
+    """Return True if a file change only adds, removes or re-indents blank space.
+    
+    Both versions must have been fetched: a side that is None (an add, a
+    delete, or a fetch that failed) never counts as whitespace-only, so a
+    failed download can't make a change look trivial. Renames and moves are
+    never whitespace-only either, since a new path can break imports or
+    references even when the content is unchanged.
+    """
+    if "rename" in diff["change_type"]:
+        return False
+    source, target = diff["source_content"], diff["target_content"]
+    if source is None or target is None:
+        return False
+    
+    def significant_lines(content: str) -> list[str]:
+        return [line.strip() for line in content.splitlines() if line.strip()]
+    
+    return significant_lines(source) == significant_lines(target)
+
+
+def needs_review(diff: dict) -> bool:
+    """Return True if a file change is worth sending to Gemini."""
+    if diff.get("skip_reason"):
+        return False
+    if diff["path"].lower().endswith(DOCS_ONLY_SUFFIXES):
+        return False
+    return not is_whitespace_only(diff)
+
+
+MAX_FILE_CHARS = 20_000  # Per content block (file or diff) in the prompt
+MAX_PROMPT_CHARS = 500_000  # Files past this point are listed by name only
+
+
+def _truncate(content: str | None, limit: int = MAX_FILE_CHARS) -> str | None:
+    """Cut content down to limit chars, noting how much was dropped."""
+    if content is None or len(content) <= limit:
+        return content
+    return f"{content[:limit]}\n... ({len(content) - limit} chars truncated)"
+
+
+def _strip_ref(ref: str) -> str:
+    """Turn 'refs/heads/feature/x' into 'feature/x'; other refs pass through."""
+    return ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+
+
+# Static framing is built once at import. The long, fixed review instructions
+# travel separately as SYSTEM_PROMPT (system_instruction), which Gemini places
+# ahead of the contents, so every request shares that prefix.
+_PROMPT_HEADER = "# Pull Request to Review\n\n"
+_PR_METADATA_TEMPLATE = string.Template(
+    "**Title:** $title\n"
+    "**ID:** $pr_id\n"
+    "**Author:** $author\n"
+    "**Description:**\n$description\n\n"
+    "**Source Branch:** $source_branch\n"
+    "**Target Branch:** $target_branch\n\n"
+    "---\n\n"
+    "# File Changes\n\n"
+)
+_PROMPT_FOOTER = "\nPlease provide your regression-focused review."
+
+
 def build_review_prompt(pr: dict, file_diffs: list) -> str:
     """Build the prompt with PR context and file diffs."""
     
-    prompt_parts = [
-        f"# Pull Request to Review\n",
-        f"**Title:** {pr.get('title', 'Untitled')}",
-        f"**ID:** {pr.get('pullRequestId')}",
-        f"**Author:** {pr.get('createdBy', {}).get('displayName', 'Unknown')}",
-        f"**Description:**\n{pr.get('description', 'No description provided.')}\n",
-        f"**Source Branch:** {pr.get('sourceRefName', '').replace('refs/heads/', '')}",
-        f"**Target Branch:** {pr.get('targetRefName', '').replace('refs/heads/', '')}\n",
-        "---\n",
-        "# File Changes\n",
-    ]
-    
-    for diff in file_diffs:
+    # Write straight into one growable buffer rather than collecting fragments
+    buf = io.StringIO()
+    w = buf.write
+    
+    w(_PROMPT_HEADER)
+    w(_PR_METADATA_TEMPLATE.substitute(
+        title=pr.get('title', 'Untitled'),
+        pr_id=pr.get('pullRequestId'),
+        author=pr.get('createdBy', {}).get('displayName', 'Unknown'),
+        description=pr.get('description', 'No description provided.'),
+        source_branch=_strip_ref(pr.get('sourceRefName', '')),
+        target_branch=_strip_ref(pr.get('targetRefName', '')),
+    ))
+    
+    for index, diff in enumerate(file_diffs):
+        if buf.tell() >= MAX_PROMPT_CHARS:
+            # Budget spent - name the rest so the review can say they were not seen
+            w("## Files not included (prompt size limit reached)\n\n")
+            for rest in file_diffs[index:]:
+                w(f"- {rest['path']} ({rest['change_type']})\n")
+            w("\n---\n\n")
+            break
+        
         path = diff["path"]
         change_type = diff["change_type"]
         
-        prompt_parts.append(f"## {path}")
-        prompt_parts.append(f"**Change Type:** {change_type}\n")
+        w(f"## {path}\n")
+        w(f"**Change Type:** {change_type}\n\n")
+        
+        if diff.get("skip_reason"):
+            w(f"*({diff['skip_reason']}, not reviewed)*\n\n")
+        
+        elif change_type in DELETED_CHANGE_TYPES:
+            w("### Deleted Content (TARGET - being removed):\n")
+            w(f"```\n{_truncate(diff['target_content']) or '(empty)'}\n```\n\n")
         
-        if change_type in ("delete", "delete, sourceRename"):
-            prompt_parts.append("### Deleted Content (TARGET - being removed):")
-            prompt_parts.append(f"```\n{diff['target_content'] or '(empty)'}\n```\n")
+        elif change_type in ADDED_CHANGE_TYPES:
+            w("### Added Content (SOURCE - new file):\n")
+            w(f"```\n{_truncate(diff['source_content']) or '(empty)'}\n```\n\n")
         
-        elif change_type in ("add",):
-            prompt_parts.append("### Added Content (SOURCE - new file):")
-            prompt_parts.append(f"```\n{diff['source_content'] or '(empty)'}\n```\n")
+        elif diff["target_content"] is not None and diff["source_content"] is not None:
+            # edit, rename, etc. - send only the changed hunks, not both full files
+            unified = build_unified_diff(path, diff["target_content"], diff["source_content"])
+            w("### Changes (unified diff, TARGET -> SOURCE):\n")
+            w(f"```diff\n{_truncate(unified) or '(no content changes)'}\n```\n\n")
         
-        else:  # edit, rename, etc.
-            prompt_parts.append("### Before (TARGET - current version):")
-            prompt_parts.append(f"```\n{diff['target_content'] or '(file did not exist)'}\n```\n")
-            prompt_parts.append("### After (SOURCE - proposed changes):")
-            prompt_parts.append(f"```\n{diff['source_content'] or '(file will be deleted)'}\n```\n")
+        else:  # one side missing - show whatever exists in full
+            w("### Before (TARGET - current version):\n")
+            w(f"```\n{_truncate(diff['target_content']) or '(file did not exist)'}\n```\n\n")
+            w("### After (SOURCE - proposed changes):\n")
+            w(f"```\n{_truncate(diff['source_content']) or '(file will be deleted)'}\n```\n\n")
         
-        prompt_parts.append("---\n")
+        w("---\n\n")
     
-    prompt_parts.append("\nPlease provide your regression-focused review.")
+    w(_PROMPT_FOOTER)
     
-    return "\n".join(prompt_parts)
+    return buf.getvalue()
 
 
 # =============================================================================
 # Vertex AI / Gemini
 # =============================================================================
 
+# Generation settings are identical for every review, so build them once
+GENERATION_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_PROMPT,
+    max_output_tokens=8192,
+    temperature=0.2,  # Lower for more focused analysis
+)
+
+# Reused across warm invocations to skip ADC discovery and channel setup
+_GENAI_CLIENT: genai.Client | None = None
+
+
+def _get_genai_client(project: str, location: str) -> genai.Client:
+    """Return the shared GenAI client, creating it on first use.
+    
+    Args:
+        project: GCP project ID for Vertex AI
+        location: GCP region for Vertex AI
+        
+    Returns:
+        Cached genai.Client configured for Vertex AI
+    """
+    global _GENAI_CLIENT
+    if _GENAI_CLIENT is None:
+        _GENAI_CLIENT = genai.Client(
+            vertexai=True,
+            project=project,
+            location=location,
+        )
+    return _GENAI_CLIENT
+
+
+LLM_CACHE_PREFIX = "llm-cache"  # GCS prefix for reviews keyed by prompt hash
+LLM_MEMORY_CACHE_MAX_ENTRIES = 64  # Reviews kept in-process; oldest dropped first
+
+_LLM_RESPONSES: dict[str, str] = {}
+_LLM_RESPONSES_LOCK = threading.Lock()  # review_pr serves concurrent requests
+
+# System prompt plus sampling settings (temperature, max_output_tokens), so
+# changing any of them stops old cached responses from being served
+_GENERATION_CONFIG_FINGERPRINT = GENERATION_CONFIG.model_dump_json(exclude_none=True)
+
+
+def llm_cache_key(model_name: str, prompt: str) -> str:
+    """Hash everything that determines the Gemini output for a prompt."""
+    digest = hashlib.sha256()
+    for part in (model_name, _GENERATION_CONFIG_FINGERPRINT, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _get_cached_response(bucket_name: str | None, key: str) -> str | None:
+    """Return a previously generated review for key, or None.
+    
+    Checks the in-process cache first, then GCS. Cache errors are logged
+    and treated as a miss so they never fail a review.
+    """
+    with _LLM_RESPONSES_LOCK:
+        cached = _LLM_RESPONSES.get(key)
+    if cached is not None:
+        logger.info("[GEMINI] Response cache hit (memory) | %s", key[:12])
+        return cached
+    if not bucket_name:
+        return None
+    
+    try:
+        text = _get_bucket(bucket_name).blob(f"{LLM_CACHE_PREFIX}/{key}.md").download_as_text(
+            timeout=GCS_TIMEOUT_SECONDS
+        )
+    except NotFound:
+        return None
+    except Exception as e:
+        logger.warning("[GEMINI] Response cache read failed, calling Gemini | Error: %s", e)
+        return None
+    
+    logger.info("[GEMINI] Response cache hit (GCS) | %s", key[:12])
+    _remember_response(key, text)
+    return text
+
+
+def _remember_response(key: str, text: str) -> None:
+    """Keep a review in the bounded in-process cache."""
+    with _LLM_RESPONSES_LOCK:
+        if key not in _LLM_RESPONSES and len(_LLM_RESPONSES) >= LLM_MEMORY_CACHE_MAX_ENTRIES:
+            del _LLM_RESPONSES[next(iter(_LLM_RESPONSES))]
+        _LLM_RESPONSES[key] = text
+
+
+def _cache_response(bucket_name: str | None, key: str, text: str) -> None:
+    """Store a generated review in memory and (write-through) GCS."""
+    _remember_response(key, text)
+    if not bucket_name:
+        return
+    
+    try:
+        _get_bucket(bucket_name).blob(f"{LLM_CACHE_PREFIX}/{key}.md").upload_from_string(
+            text,
+            content_type="text/markdown; charset=utf-8",
+            if_generation_match=0,  # Identical key means identical content
+            timeout=GCS_TIMEOUT_SECONDS,
+        )
+    except PreconditionFailed:
+        pass  # Another instance cached the same response first
+    except Exception as e:
+        logger.warning("[GEMINI] Response cache write failed | Error: %s", e)
+
+
 def call_gemini(config: dict, prompt: str) -> str:
-    """Send prompt to Gemini via Vertex AI and return response."""
+    """Send prompt to Gemini via Vertex AI and return response.
+    
+    Responses are cached by a hash of the model, system prompt and prompt,
+    in memory and under llm-cache/ in GCS_BUCKET, so retries and re-runs
+    of an unchanged PR don't pay for a second generation.
+    """
     
     model_name = config["GEMINI_MODEL"]
     project = config["VERTEX_PROJECT"]
     location = config["VERTEX_LOCATION"]
     
-    logger.info(f"[GEMINI] Calling Vertex AI | Model: {model_name} | Project: {project} | Location: {location}")
-    logger.info(f"[GEMINI] Prompt size: {len(prompt)} chars | System prompt: {len(SYSTEM_PROMPT)} chars")
-    logger.debug(f"[GEMINI] Config: max_output_tokens=8192, temperature=0.2")
+    logger.info("[GEMINI] Calling Vertex AI | Model: %s | Project: %s | Location: %s", model_name, project, location)
+    logger.info("[GEMINI] Prompt size: %s chars | System prompt: %s chars", len(prompt), len(SYSTEM_PROMPT))
+    logger.debug("[GEMINI] Config: max_output_tokens=%s, temperature=%s", GENERATION_CONFIG.max_output_tokens, GENERATION_CONFIG.temperature)
+    
+    bucket_name = config.get("GCS_BUCKET")
+    cache_key = llm_cache_key(model_name, prompt)
+    cached = _get_cached_response(bucket_name, cache_key)
+    if cached is not None:
+        return cached
     
     with timed_operation() as elapsed:
         try:
-            # Initialize the GenAI client for Vertex AI
-            client = genai.Client(
-                vertexai=True,
-                project=project,
-                location=location,
-            )
+            client = _get_genai_client(project, location)
             
-            logger.debug(f"[GEMINI] Client initialized in {elapsed():.0f}ms")
+            logger.debug("[GEMINI] Client ready in %.0fms", elapsed())
             
             # Generate content with system instruction
             generate_start = time.time()
             response = client.models.generate_content(
                 model=model_name,
                 contents=prompt,
-                config={
-                    "system_instruction": SYSTEM_PROMPT,
-                    "max_output_tokens": 8192,
-                    "temperature": 0.2,  # Lower for more focused analysis
-                },
+                config=GENERATION_CONFIG,
             )
             
             generate_time = (time.time() - generate_start) * 1000
             response_size = len(response.text) if response.text else 0
             
-            logger.info(f"[GEMINI] Response received | {response_size} chars | Generate: {generate_time:.0f}ms | Total: {elapsed():.0f}ms")
+            logger.info("[GEMINI] Response received | %s chars | Generate: %.0fms | Total: %.0fms", response_size, generate_time, elapsed())
             
             # Log usage metadata if available
             if hasattr(response, 'usage_metadata') and response.usage_metadata:
                 usage = response.usage_metadata
-                logger.info(f"[GEMINI] Tokens - Input: {getattr(usage, 'prompt_token_count', 'N/A')} | Output: {getattr(usage, 'candidates_token_count', 'N/A')}")
+                # Cached: prompt tokens served from Gemini's implicit prefix cache
+                logger.info("[GEMINI] Tokens - Input: %s | Cached: %s | Output: %s", getattr(usage, 'prompt_token_count', 'N/A'), getattr(usage, 'cached_content_token_count', None) or 0, getattr(usage, 'candidates_token_count', 'N/A'))
             
+            if response.text:
+                _cache_response(bucket_name, cache_key, response.text)
             return response.text
             
         except Exception as e:
-            logger.error(f"[GEMINI] API call FAILED | {elapsed():.0f}ms | Error type: {type(e).__name__}")
-            logger.error(f"[GEMINI] Error details: {str(e)}")
+            logger.error("[GEMINI] API call FAILED | %.0fms | Error type: %s", elapsed(), type(e).__name__)
+            logger.error("[GEMINI] Error details: %s", e)
             raise
 
 
@@ -887,13 +1624,13 @@ def process_pr_review(
     pr_title = pr.get("title", "Untitled")
     pr_author = pr.get("createdBy", {}).get("displayName", "Unknown")
     
-    logger.info(f"[REVIEW] Starting review for PR #{pr_id}: '{pr_title}' by {pr_author}")
-    logger.info(f"[REVIEW] Files to review: {len(file_diffs)}")
+    logger.info("[REVIEW] Starting review for PR #%s: '%s' by %s", pr_id, pr_title, pr_author)
+    logger.info("[REVIEW] Files to review: %s", len(file_diffs))
     
     # Build prompt and call Gemini
     logger.info("[REVIEW] Building prompt and calling Gemini")
     prompt = build_review_prompt(pr, file_diffs)
-    logger.info(f"[REVIEW] Prompt built: {len(prompt)} chars")
+    logger.info("[REVIEW] Prompt built: %s chars", len(prompt))
     
     review = call_gemini(config, prompt)
     
@@ -902,7 +1639,7 @@ def process_pr_review(
     max_severity = get_max_severity(review)
     has_blocking = max_severity == "action-required"
     has_warning = max_severity == "review-recommended"
-    logger.info(f"[REVIEW] Priority: {max_severity} | action_required={has_blocking} | review_recommended={has_warning}")
+    logger.info("[REVIEW] Priority: %s | action_required=%s | review_recommended=%s", max_severity, has_blocking, has_warning)
     
     # Save to Cloud Storage
     logger.info("[REVIEW] Saving to Cloud Storage")
@@ -913,7 +1650,7 @@ def process_pr_review(
     action_taken = None
     
     if has_blocking or has_warning:
-        logger.info(f"[ACTION] Posting review comment to PR #{pr_id}")
+        logger.info("[ACTION] Posting review comment to PR #%s", pr_id)
         
         # Build comment with standard header
         comment_header = "## 🔍 Automated Regression Review\n\n"
@@ -935,13 +1672,13 @@ def process_pr_review(
             user_id = ado.get_current_user_id()
             ado.reject_pr(pr_id, user_id)
             action_taken = "rejected"
-            logger.info(f"[ACTION] PR #{pr_id} rejected")
+            logger.info("[ACTION] PR #%s rejected", pr_id)
         else:
             action_taken = "commented"
     else:
         logger.info("[ACTION] No issues found - no action taken on PR")
     
-    logger.info(f"[REVIEW] Complete | Severity: {max_severity} | Action: {action_taken or 'none'}")
+    logger.info("[REVIEW] Complete | Severity: %s | Action: %s", max_severity, action_taken or 'none')
     
     return ReviewResult(
         pr_id=pr_id,
@@ -967,6 +1704,21 @@ def make_response(data: dict, status: int = 200) -> tuple:
     return (json.dumps(data), status, {"Content-Type": "application/json"})
 
 
+def is_valid_api_key(provided: str | None, expected: str | None) -> bool:
+    """Check a request API key against the configured one in constant time.
+    
+    Args:
+        provided: Value of the X-API-Key header (may be None)
+        expected: Configured API key
+        
+    Returns:
+        True if both keys are non-empty and match
+    """
+    if not provided or not expected:
+        return False
+    return hmac.compare_digest(provided.encode(), expected.encode())
+
+
 @functions_framework.http
 def review_pr(request):
     """HTTP Cloud Function entry point for PR regression review.
@@ -981,12 +1733,12 @@ def review_pr(request):
     with timed_operation() as elapsed:
         logger.info("=" * 60)
         logger.info("[REQUEST] PR Review function invoked")
-        logger.info(f"[REQUEST] Method: {request.method} | Path: {request.path}")
+        logger.info("[REQUEST] Method: %s | Path: %s", request.method, request.path)
         
         # Load config
         config, missing = load_config()
         if missing:
-            logger.error(f"[CONFIG] Missing required environment variables: {missing}")
+            logger.error("[CONFIG] Missing required environment variables: %s", missing)
             return make_response(
                 {"error": f"Missing config: {', '.join(missing)}"}, 500
             )
@@ -994,7 +1746,7 @@ def review_pr(request):
         
         # Validate API key
         api_key = request.headers.get("X-API-Key")
-        if not api_key or api_key != config["API_KEY"]:
+        if not is_valid_api_key(api_key, config["API_KEY"]):
             logger.warning("[AUTH] Invalid or missing API key")
             return make_response({"error": "Invalid or missing API key"}, 401)
         logger.info("[AUTH] API key validated")
@@ -1012,34 +1764,29 @@ def review_pr(request):
                 return make_response({"error": "Missing required field: pr_id"}, 400)
             
             pr_id = int(pr_id)
-            logger.info(f"[REQUEST] Processing PR #{pr_id}")
+            logger.info("[REQUEST] Processing PR #%s", pr_id)
         except (ValueError, TypeError) as e:
-            logger.error(f"[REQUEST] Invalid pr_id format: {e}")
+            logger.error("[REQUEST] Invalid pr_id format: %s", e)
             return make_response({"error": f"Invalid pr_id: {e}"}, 400)
         
-        # Initialize Azure DevOps client
-        logger.info(f"[ADO] Initializing client | Org: {config['AZURE_DEVOPS_ORG']} | Project: {config['AZURE_DEVOPS_PROJECT']} | Repo: {config['AZURE_DEVOPS_REPO']}")
-        ado = AzureDevOpsClient(
-            org=config["AZURE_DEVOPS_ORG"],
-            project=config["AZURE_DEVOPS_PROJECT"],
-            repo=config["AZURE_DEVOPS_REPO"],
-            pat=config["AZURE_DEVOPS_PAT"],
-        )
+        # Get the (warm-instance cached) Azure DevOps client
+        logger.info("[ADO] Using client | Org: %s | Project: %s | Repo: %s", config['AZURE_DEVOPS_ORG'], config['AZURE_DEVOPS_PROJECT'], config['AZURE_DEVOPS_REPO'])
+        ado = _get_ado_client(config)
         
         try:
             # Fetch PR data
-            logger.info(f"[FLOW] Step 1/3: Fetching PR metadata")
-            pr = ado.get_pull_request(pr_id)
+            logger.info("[FLOW] Step 1/3: Fetching PR metadata and changes")
+            pr, changes = ado.get_pull_request_with_changes(pr_id)
             pr_title = pr.get("title", "Untitled")
             pr_author = pr.get("createdBy", {}).get("displayName", "Unknown")
-            logger.info(f"[FLOW] PR: '{pr_title}' by {pr_author}")
+            logger.info("[FLOW] PR: '%s' by %s", pr_title, pr_author)
             
             # Fetch file diffs
-            logger.info(f"[FLOW] Step 2/3: Fetching file diffs")
-            file_diffs = ado.get_pr_diff(pr_id)
+            logger.info("[FLOW] Step 2/3: Fetching file diffs")
+            file_diffs = ado.get_pr_diff(pr_id, pr=pr, changes=changes)
             
             if not file_diffs:
-                logger.info(f"[FLOW] No file changes found | Total time: {elapsed():.0f}ms")
+                logger.info("[FLOW] No file changes found | Total time: %.0fms", elapsed())
                 return make_response({
                     "pr_id": pr_id,
                     "title": pr_title,
@@ -1051,15 +1798,28 @@ def review_pr(request):
                     "storage_path": None,
                 })
             
-            logger.info(f"[FLOW] Found {len(file_diffs)} files to review")
+            if not any(needs_review(diff) for diff in file_diffs):
+                logger.info("[FLOW] Only docs/whitespace/skipped files changed - no review needed | Total time: %.0fms", elapsed())
+                return make_response({
+                    "pr_id": pr_id,
+                    "title": pr_title,
+                    "message": "Only documentation, whitespace or non-reviewable files changed in this PR",
+                    "has_blocking": False,
+                    "has_warning": False,
+                    "action_taken": None,
+                    "commented": False,
+                    "storage_path": None,
+                })
+            
+            logger.info("[FLOW] Found %s files to review", len(file_diffs))
             for diff in file_diffs:
-                logger.debug(f"[FLOW]   - {diff['path']} ({diff['change_type']})")
+                logger.debug("[FLOW]   - %s (%s)", diff['path'], diff['change_type'])
             
             # Process the review using shared logic
-            logger.info(f"[FLOW] Step 3/3: Processing review")
+            logger.info("[FLOW] Step 3/3: Processing review")
             result = process_pr_review(config, ado, pr_id, pr, file_diffs)
             
-            logger.info(f"[COMPLETE] PR #{pr_id} review finished | Severity: {result.max_severity} | Action: {result.action_taken or 'none'} | Total time: {elapsed():.0f}ms")
+            logger.info("[COMPLETE] PR #%s review finished | Severity: %s | Action: %s | Total time: %.0fms", pr_id, result.max_severity, result.action_taken or 'none', elapsed())
             logger.info("=" * 60)
             
             return make_response({
@@ -1075,15 +1835,18 @@ def review_pr(request):
                 "review_preview": result.review_text[:500] + "..." if len(result.review_text) > 500 else result.review_text,
             })
             
+        except PRNotReadyError as e:
+            logger.warning("[SKIP] %s | %.0fms", e, elapsed())
+            return make_response({"error": str(e)}, 409)
         except requests.HTTPError as e:
-            logger.error(f"[ERROR] Azure DevOps API error | Status: {e.response.status_code} | {elapsed():.0f}ms")
-            logger.error(f"[ERROR] Response body: {e.response.text[:500]}")
+            logger.error("[ERROR] Azure DevOps API error | Status: %s | %.0fms", e.response.status_code, elapsed())
+            logger.error("[ERROR] Response body: %s", e.response.text[:500])
             return make_response({
                 "error": f"Azure DevOps API error: {e.response.status_code} - {e.response.text}"
             }, 502)
         except Exception as e:
-            logger.error(f"[ERROR] Internal error | Type: {type(e).__name__} | {elapsed():.0f}ms")
-            logger.error(f"[ERROR] Details: {str(e)}", exc_info=True)
+            logger.error("[ERROR] Internal error | Type: %s | %.0fms", type(e).__name__, elapsed())
+            logger.error("[ERROR] Details: %s", e, exc_info=True)
             return make_response({"error": f"Internal error: {str(e)}"}, 500)
 
 
@@ -1121,7 +1884,7 @@ def review_pr_pubsub(cloud_event: CloudEvent) -> None:
         # Load config
         config, missing = load_config()
         if missing:
-            logger.error(f"[CONFIG] Missing required environment variables: {missing}")
+            logger.error("[CONFIG] Missing required environment variables: %s", missing)
             # Don't raise - acknowledge message to prevent infinite retries on config errors
             return
         logger.info("[CONFIG] All required environment variables loaded")
@@ -1146,28 +1909,25 @@ def review_pr_pubsub(cloud_event: CloudEvent) -> None:
             # Extract commit_sha from message (provided by webhook receiver)
             message_commit_sha = message.get("commit_sha")
             if message_commit_sha:
-                logger.info(f"[PUBSUB] Processing PR #{pr_id} @ {message_commit_sha[:8]} (from message)")
+                logger.info("[PUBSUB] Processing PR #%s @ %s (from message)", pr_id, message_commit_sha[:8])
             else:
-                logger.info(f"[PUBSUB] Processing PR #{pr_id} (commit_sha will be fetched from ADO)")
+                logger.info("[PUBSUB] Processing PR #%s (commit_sha will be fetched from ADO)", pr_id)
             
         except (ValueError, TypeError, json.JSONDecodeError) as e:
-            logger.error(f"[PUBSUB] Failed to parse message: {e}")
+            logger.error("[PUBSUB] Failed to parse message: %s", e)
             return  # Acknowledge to prevent retries on malformed messages
         
-        # Initialize Azure DevOps client
-        logger.info(f"[ADO] Initializing client | Org: {config['AZURE_DEVOPS_ORG']} | Project: {config['AZURE_DEVOPS_PROJECT']}")
-        ado = AzureDevOpsClient(
-            org=config["AZURE_DEVOPS_ORG"],
-            project=config["AZURE_DEVOPS_PROJECT"],
-            repo=config["AZURE_DEVOPS_REPO"],
-            pat=config["AZURE_DEVOPS_PAT"],
-        )
+        # Get the (warm-instance cached) Azure DevOps client
+        logger.info("[ADO] Using client | Org: %s | Project: %s", config['AZURE_DEVOPS_ORG'], config['AZURE_DEVOPS_PROJECT'])
+        ado = _get_ado_client(config)
         
         commit_sha = None
         
         try:
             # Fetch PR metadata
-            logger.info(f"[FLOW] Step 1/4: Fetching PR metadata")
+            # Changes are listed only after the claim below, so duplicate and
+            # already-completed deliveries cost a single ADO call
+            logger.info("[FLOW] Step 1/4: Fetching PR metadata")
             pr = ado.get_pull_request(pr_id)
             pr_title = pr.get("title", "Untitled")
             pr_author = pr.get("createdBy", {}).get("displayName", "Unknown")
@@ -1175,59 +1935,79 @@ def review_pr_pubsub(cloud_event: CloudEvent) -> None:
             # Use commit_sha from message if provided, otherwise fetch from PR metadata
             if message_commit_sha:
                 commit_sha = message_commit_sha
-                logger.info(f"[FLOW] Using commit_sha from message: {commit_sha[:8]}")
+                logger.info("[FLOW] Using commit_sha from message: %s", commit_sha[:8])
             else:
                 last_merge_commit = pr.get("lastMergeSourceCommit")
                 if not last_merge_commit or "commitId" not in last_merge_commit:
-                    logger.warning(f"[SKIP] PR #{pr_id} has no lastMergeSourceCommit - may be draft or empty")
+                    logger.warning("[SKIP] PR #%s has no lastMergeSourceCommit - may be draft or empty", pr_id)
                     logger.info("=" * 60)
                     return
                 commit_sha = last_merge_commit["commitId"]
-                logger.info(f"[FLOW] Fetched commit_sha from ADO: {commit_sha[:8]}")
+                logger.info("[FLOW] Fetched commit_sha from ADO: %s", commit_sha[:8])
             
-            logger.info(f"[FLOW] PR: '{pr_title}' by {pr_author} @ commit {commit_sha[:8]}")
+            logger.info("[FLOW] PR: '%s' by %s @ commit %s", pr_title, pr_author, commit_sha[:8])
             
             # Idempotency check
-            logger.info(f"[FLOW] Step 2/4: Checking idempotency")
+            logger.info("[FLOW] Step 2/4: Checking idempotency")
             bucket_name = config["GCS_BUCKET"]
             if not check_and_claim_processing(bucket_name, pr_id, commit_sha):
-                logger.info(f"[COMPLETE] PR #{pr_id} @ {commit_sha[:8]} already processed | {elapsed():.0f}ms")
+                logger.info("[COMPLETE] PR #%s @ %s already processed | %.0fms", pr_id, commit_sha[:8], elapsed())
                 logger.info("=" * 60)
                 return  # Already processed - acknowledge and exit
             
             # Fetch file diffs
-            logger.info(f"[FLOW] Step 3/4: Fetching file diffs")
-            file_diffs = ado.get_pr_diff(pr_id)
+            logger.info("[FLOW] Step 3/4: Fetching file diffs")
+            file_diffs = ado.get_pr_diff(pr_id, pr=pr)
             
             if not file_diffs:
-                logger.info(f"[FLOW] No file changes found")
+                logger.info("[FLOW] No file changes found")
                 update_marker_completed(bucket_name, pr_id, commit_sha, "info", False)
-                logger.info(f"[COMPLETE] PR #{pr_id} - no files to review | {elapsed():.0f}ms")
+                logger.info("[COMPLETE] PR #%s - no files to review | %.0fms", pr_id, elapsed())
                 logger.info("=" * 60)
                 return
             
-            logger.info(f"[FLOW] Found {len(file_diffs)} files to review")
+            if not any(needs_review(diff) for diff in file_diffs):
+                logger.info("[FLOW] Only docs/whitespace/skipped files changed - no review needed")
+                update_marker_completed(bucket_name, pr_id, commit_sha, "info", False)
+                logger.info("[COMPLETE] PR #%s - nothing worth reviewing | %.0fms", pr_id, elapsed())
+                logger.info("=" * 60)
+                return
+            
+            logger.info("[FLOW] Found %s files to review", len(file_diffs))
             
             # Process the review using shared logic
-            logger.info(f"[FLOW] Step 4/4: Processing review")
+            logger.info("[FLOW] Step 4/4: Processing review")
             result = process_pr_review(config, ado, pr_id, pr, file_diffs)
             
             # Update idempotency marker with completion status
             update_marker_completed(bucket_name, pr_id, commit_sha, result.max_severity, result.commented)
             
-            logger.info(f"[COMPLETE] PR #{pr_id} @ {commit_sha[:8]} review finished | Severity: {result.max_severity} | {elapsed():.0f}ms")
+            logger.info("[COMPLETE] PR #%s @ %s review finished | Severity: %s | %.0fms", pr_id, commit_sha[:8], result.max_severity, elapsed())
             logger.info("=" * 60)
             
+        except PRNotReadyError as e:
+            # Retrying straight away won't help; count the attempt and let the
+            # subscription's retry backoff space out the redelivery
+            error_msg = str(e)
+            logger.warning("[RETRY] %s | %.0fms", error_msg, elapsed())
+            if commit_sha:
+                should_retry = update_marker_for_retry(config["GCS_BUCKET"], pr_id, commit_sha, error_msg)
+                if not should_retry:
+                    logger.error("[ABORT] PR #%s @ %s never became ready - giving up", pr_id, commit_sha[:8])
+                    logger.info("=" * 60)
+                    return  # Acknowledge message to stop retries
+            raise  # Re-raise to trigger Pub/Sub retry
+            
         except requests.HTTPError as e:
             status_code = e.response.status_code if e.response is not None else 0
             error_msg = f"Azure DevOps API error: {status_code}"
-            logger.error(f"[ERROR] {error_msg} | {elapsed():.0f}ms")
+            logger.error("[ERROR] %s | %.0fms", error_msg, elapsed())
             
             # Non-retryable HTTP errors - acknowledge immediately (will go to DLQ)
             # 401: Unauthorized (bad PAT), 403: Forbidden (no permissions), 404: PR not found
             non_retryable_codes = {401, 403, 404}
             if status_code in non_retryable_codes:
-                logger.error(f"[DLQ] Non-retryable error {status_code} for PR #{pr_id} - acknowledging for DLQ")
+                logger.error("[DLQ] Non-retryable error %s for PR #%s - acknowledging for DLQ", status_code, pr_id)
                 if commit_sha:
                     # Mark as permanently failed
                     update_marker_failed(config["GCS_BUCKET"], pr_id, commit_sha, error_msg)
@@ -1238,20 +2018,20 @@ def review_pr_pubsub(cloud_event: CloudEvent) -> None:
             if commit_sha:
                 should_retry = update_marker_for_retry(config["GCS_BUCKET"], pr_id, commit_sha, error_msg)
                 if not should_retry:
-                    logger.error(f"[ABORT] PR #{pr_id} @ {commit_sha[:8]} max retries exceeded - giving up")
+                    logger.error("[ABORT] PR #%s @ %s max retries exceeded - giving up", pr_id, commit_sha[:8])
                     logger.info("=" * 60)
                     return  # Acknowledge message to stop retries
             raise  # Re-raise to trigger Pub/Sub retry
             
         except Exception as e:
             error_msg = f"{type(e).__name__}: {str(e)}"
-            logger.error(f"[ERROR] Internal error | Type: {type(e).__name__} | {elapsed():.0f}ms")
-            logger.error(f"[ERROR] Details: {str(e)}", exc_info=True)
+            logger.error("[ERROR] Internal error | Type: %s | %.0fms", type(e).__name__, elapsed())
+            logger.error("[ERROR] Details: %s", e, exc_info=True)
             # Update retry counter and check if we should retry
             if commit_sha:
                 should_retry = update_marker_for_retry(config["GCS_BUCKET"], pr_id, commit_sha, error_msg)
                 if not should_retry:
-                    logger.error(f"[ABORT] PR #{pr_id} @ {commit_sha[:8]} max retries exceeded - giving up")
+                    logger.error("[ABORT] PR #%s @ %s max retries exceeded - giving up", pr_id, commit_sha[:8])
                     logger.info("=" * 60)
                     return  # Acknowledge message to stop retries
             raise  # Re-raise to trigger Pub/Sub retry
@@ -1261,27 +2041,140 @@ def review_pr_pubsub(cloud_event: CloudEvent) -> None:
 # Webhook Receiver Cloud Function Entry Point
 # =============================================================================
 
-def load_webhook_config() -> tuple[dict, list]:
+@dataclass(frozen=True, slots=True)
+class WebhookConfig:
+    """Webhook receiver configuration, read from the environment once per instance."""
+    api_key: str
+    vertex_project: str
+    pubsub_topic: str
+
+
+# Environment variables don't change for the life of a container instance
+_WEBHOOK_CONFIG: WebhookConfig | None = None
+
+
+def _reload_config() -> WebhookConfig:
+    """Re-read the webhook configuration from os.environ and cache it."""
+    global _WEBHOOK_CONFIG
+    _WEBHOOK_CONFIG = WebhookConfig(
+        api_key=os.environ.get("API_KEY", ""),
+        vertex_project=os.environ.get("VERTEX_PROJECT", ""),
+        pubsub_topic=os.environ.get("PUBSUB_TOPIC", "pr-review-trigger"),
+    )
+    return _WEBHOOK_CONFIG
+
+
+def load_webhook_config() -> tuple[WebhookConfig, list]:
     """Load minimal configuration for webhook receiver.
     
+    The environment is read on the first call only; later calls return the
+    cached WebhookConfig.
+    
     Returns:
-        tuple: (config dict, list of missing required vars)
+        tuple: (WebhookConfig, list of missing required vars)
     """
-    required = ["API_KEY", "VERTEX_PROJECT"]
-    
-    config = {}
-    missing = []
-    
-    for var in required:
-        value = os.environ.get(var)
-        if not value:
-            missing.append(var)
-        config[var] = value
+    config = _WEBHOOK_CONFIG or _reload_config()
+    missing = [var for var, value in (("API_KEY", config.api_key), ("VERTEX_PROJECT", config.vertex_project))
+               if not value]
+    return config, missing
+
+
+WEBHOOK_MAX_BODY_BYTES = 4096  # {"pr_id", "commit_sha"} payloads are ~100 bytes
+
+# Abbreviated (7) to full (40) hex commit SHA
+COMMIT_SHA_PATTERN = re.compile(r"[0-9a-fA-F]{7,40}")
+
+# Static tail of every webhook message, encoded once at import
+_WEBHOOK_MESSAGE_SUFFIX = b'","source":"azure-devops-pipeline"}'
+
+
+def build_webhook_message(pr_id: int, commit_sha: str, received_at: str) -> bytes:
+    """Encode the Pub/Sub message for a validated webhook request.
     
-    # Optional with default
-    config["PUBSUB_TOPIC"] = os.environ.get("PUBSUB_TOPIC", "pr-review-trigger")
+    The payload has a fixed shape, so the JSON is assembled directly from
+    bytes instead of building and serializing a dict. Inputs must already
+    be validated: pr_id an int, commit_sha hex, and received_at an ISO
+    timestamp, so none of them need JSON escaping.
     
-    return config, missing
+    Args:
+        pr_id: Pull request ID
+        commit_sha: Hex commit SHA
+        received_at: ISO 8601 receive timestamp
+        
+    Returns:
+        Compact JSON bytes: {"pr_id", "commit_sha", "received_at", "source"}
+    """
+    return (
+        b'{"pr_id":' + str(pr_id).encode()
+        + b',"commit_sha":"' + commit_sha.encode()
+        + b'","received_at":"' + received_at.encode()
+        + _WEBHOOK_MESSAGE_SUFFIX
+    )
+
+
+# Coalesce publishes from concurrent webhook requests into one RPC. The webhook
+# waits for the ack, so the window is added to its latency - keep it short.
+PUBSUB_BATCH_SETTINGS = pubsub_v1.types.BatchSettings(
+    max_messages=100,
+    max_bytes=1_000_000,
+    max_latency=0.01,  # seconds
+)
+
+# Reused across warm invocations to skip credential and channel setup
+_PUBLISHER: pubsub_v1.PublisherClient | None = None
+
+
+def _get_publisher() -> pubsub_v1.PublisherClient:
+    """Return the shared Pub/Sub publisher, creating it on first use."""
+    global _PUBLISHER
+    if _PUBLISHER is None:
+        _PUBLISHER = pubsub_v1.PublisherClient(batch_settings=PUBSUB_BATCH_SETTINGS)
+    return _PUBLISHER
+
+
+# (project, topic) -> fully-qualified topic path; fixed for a deployment
+_TOPIC_PATHS: dict[tuple[str, str], str] = {}
+
+
+def _get_topic_path(project: str, topic: str) -> str:
+    """Return the cached Pub/Sub topic path for project/topic."""
+    key = (project, topic)
+    topic_path = _TOPIC_PATHS.get(key)
+    if topic_path is None:
+        topic_path = _TOPIC_PATHS[key] = _get_publisher().topic_path(project, topic)
+    return topic_path
+
+
+WEBHOOK_DEDUP_TTL_SECONDS = 60  # Window in which a repeated (pr_id, commit_sha) is not republished
+WEBHOOK_DEDUP_MAX_ENTRIES = 4096
+
+# (pr_id, commit_sha) -> (monotonic publish time, message_id), per container instance
+_WEBHOOK_DEDUP: dict[tuple[int, str], tuple[float, str]] = {}
+_WEBHOOK_DEDUP_LOCK = threading.Lock()  # Webhook requests are served concurrently
+
+
+def _get_recent_publish(pr_id: int, commit_sha: str) -> str | None:
+    """Return the message_id of a publish for this PR+commit within the TTL window."""
+    with _WEBHOOK_DEDUP_LOCK:
+        hit = _WEBHOOK_DEDUP.get((pr_id, commit_sha))
+    if hit and time.monotonic() - hit[0] < WEBHOOK_DEDUP_TTL_SECONDS:
+        return hit[1]
+    return None
+
+
+def _record_publish(pr_id: int, commit_sha: str, message_id: str) -> None:
+    """Remember a successful publish, pruning expired entries when the cache is full."""
+    now = time.monotonic()
+    with _WEBHOOK_DEDUP_LOCK:
+        if len(_WEBHOOK_DEDUP) >= WEBHOOK_DEDUP_MAX_ENTRIES:
+            expired = [key for key, (published_at, _) in _WEBHOOK_DEDUP.items()
+                       if now - published_at >= WEBHOOK_DEDUP_TTL_SECONDS]
+            for key in expired:
+                del _WEBHOOK_DEDUP[key]
+            if len(_WEBHOOK_DEDUP) >= WEBHOOK_DEDUP_MAX_ENTRIES:
+                # Still full of live entries - drop the oldest (dicts keep insertion order)
+                del _WEBHOOK_DEDUP[next(iter(_WEBHOOK_DEDUP))]
+        _WEBHOOK_DEDUP[(pr_id, commit_sha)] = (now, message_id)
 
 
 @functions_framework.http
@@ -1325,12 +2218,12 @@ def process_dead_letter_queue(request):
         # Load config
         config, missing = load_config()
         if missing:
-            logger.error(f"[CONFIG] Missing required environment variables: {missing}")
+            logger.error("[CONFIG] Missing required environment variables: %s", missing)
             return make_response({"error": f"Missing config: {', '.join(missing)}"}, 500)
 
         # Validate API key
         api_key = request.headers.get("X-API-Key")
-        if not api_key or api_key != config["API_KEY"]:
+        if not is_valid_api_key(api_key, config["API_KEY"]):
             logger.warning("[AUTH] Invalid or missing API key")
             return make_response({"error": "Invalid or missing API key"}, 401)
 
@@ -1348,36 +2241,31 @@ def process_dead_letter_queue(request):
         except (ValueError, TypeError):
             return make_response({"error": "max_messages must be an integer"}, 400)
 
-        logger.info(f"[DLQ] Processing parameters: max_messages={max_messages}, dry_run={dry_run}")
+        logger.info("[DLQ] Processing parameters: max_messages=%s, dry_run=%s", max_messages, dry_run)
 
         # Step 1: Validate Azure DevOps credentials before processing
         logger.info("[DLQ] Step 1/3: Validating Azure DevOps credentials")
-        ado = AzureDevOpsClient(
-            org=config["AZURE_DEVOPS_ORG"],
-            project=config["AZURE_DEVOPS_PROJECT"],
-            repo=config["AZURE_DEVOPS_REPO"],
-            pat=config["AZURE_DEVOPS_PAT"],
-        )
+        ado = _get_ado_client(config)
 
         try:
             # Test credentials by getting current user
             user_id = ado.get_current_user_id()
-            logger.info(f"[DLQ] Credentials validated successfully (user: {user_id[:8]}...)")
+            logger.info("[DLQ] Credentials validated successfully (user: %s...)", user_id[:8])
         except requests.HTTPError as e:
             status_code = e.response.status_code if e.response else 500
-            logger.error(f"[DLQ] Credential validation FAILED: {status_code}")
+            logger.error("[DLQ] Credential validation FAILED: %s", status_code)
             return make_response({
                 "error": "Azure DevOps credentials validation failed. Please check your PAT.",
                 "status_code": status_code
             }, 401)
         except requests.RequestException as e:
-            logger.error(f"[DLQ] Credential validation error: {str(e)}")
+            logger.error("[DLQ] Credential validation error: %s", e)
             return make_response({
                 "error": f"Failed to validate credentials: {str(e)}"
             }, 500)
 
         # Step 2: Pull messages from DLQ
-        logger.info(f"[DLQ] Step 2/3: Pulling up to {max_messages} messages from DLQ")
+        logger.info("[DLQ] Step 2/3: Pulling up to %s messages from DLQ", max_messages)
 
         subscriber = pubsub_v1.SubscriberClient()
         dlq_subscription_path = subscriber.subscription_path(
@@ -1396,16 +2284,16 @@ def process_dead_letter_queue(request):
                 )
 
             messages_pulled = len(response.received_messages)
-            logger.info(f"[DLQ] Pulled {messages_pulled} messages from DLQ | {pull_elapsed():.0f}ms")
+            logger.info("[DLQ] Pulled %s messages from DLQ | %.0fms", messages_pulled, pull_elapsed())
 
         except Exception as e:
-            logger.error(f"[DLQ] Failed to pull messages from DLQ: {e}")
+            logger.error("[DLQ] Failed to pull messages from DLQ: %s", e)
             return make_response({
                 "error": f"Failed to pull from DLQ: {str(e)}"
             }, 500)
 
         if messages_pulled == 0:
-            logger.info(f"[DLQ] No messages in DLQ | {elapsed():.0f}ms")
+            logger.info("[DLQ] No messages in DLQ | %.0fms", elapsed())
             logger.info("=" * 60)
             return make_response({
                 "status": "completed",
@@ -1417,10 +2305,10 @@ def process_dead_letter_queue(request):
             })
 
         # Step 3: Process and republish messages
-        logger.info(f"[DLQ] Step 3/3: Processing {messages_pulled} messages")
+        logger.info("[DLQ] Step 3/3: Processing %s messages", messages_pulled)
 
-        publisher = pubsub_v1.PublisherClient()
-        main_topic_path = publisher.topic_path(
+        publisher = _get_publisher()
+        main_topic_path = _get_topic_path(
             config["VERTEX_PROJECT"],
             config.get("PUBSUB_TOPIC", "pr-review-trigger")
         )
@@ -1430,9 +2318,8 @@ def process_dead_letter_queue(request):
         details = []
         ack_ids = []
 
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(config["GCS_BUCKET"])
-
+        # Pass 1: decode and triage messages; collect the ones to republish
+        pending = []  # (received_message, pr_id, commit_sha)
         for received_message in response.received_messages:
             pr_id = None
             commit_sha = None
@@ -1442,10 +2329,10 @@ def process_dead_letter_queue(request):
                 pr_id = message_data.get("pr_id")
                 commit_sha = message_data.get("commit_sha")
 
-                logger.info(f"[DLQ] Processing PR #{pr_id} @ {commit_sha[:8] if commit_sha else 'unknown'}")
+                logger.info("[DLQ] Processing PR #%s @ %s", pr_id, commit_sha[:8] if commit_sha else 'unknown')
 
                 if not pr_id:
-                    logger.warning(f"[DLQ] Skipping message with missing pr_id (will acknowledge to clear from DLQ)")
+                    logger.warning("[DLQ] Skipping message with missing pr_id (will acknowledge to clear from DLQ)")
                     details.append({
                         "pr_id": None,
                         "status": "skipped",
@@ -1456,7 +2343,7 @@ def process_dead_letter_queue(request):
                     continue
 
                 if dry_run:
-                    logger.info(f"[DLQ] DRY RUN: Would republish PR #{pr_id}")
+                    logger.info("[DLQ] DRY RUN: Would republish PR #%s", pr_id)
                     details.append({
                         "pr_id": pr_id,
                         "commit_sha": commit_sha[:8] if commit_sha else None,
@@ -1468,14 +2355,36 @@ def process_dead_letter_queue(request):
                     ack_ids.append(received_message.ack_id)
                     continue
 
-                # Reset idempotency marker if commit_sha is available
-                if commit_sha:
-                    marker_blob = bucket.blob(f"idempotency/pr-{pr_id}-{commit_sha}.json")
-                    if marker_blob.exists():
-                        logger.info(f"[DLQ] Deleting idempotency marker for PR #{pr_id} @ {commit_sha[:8]}")
-                        marker_blob.delete()
+                pending.append((received_message, pr_id, commit_sha))
 
-                # Republish to main topic
+            except Exception as e:
+                logger.error("[DLQ] Failed to process message: %s", e)
+                details.append({
+                    "pr_id": pr_id,
+                    "status": "failed",
+                    "error": str(e)
+                })
+                messages_failed += 1
+
+        # Reset idempotency markers (where commit_sha is available) in batched requests,
+        # before republishing so the new attempts are not skipped as already failed
+        markers = [(pr_id, commit_sha) for _, pr_id, commit_sha in pending if commit_sha]
+        try:
+            reset_markers(config["GCS_BUCKET"], markers)
+        except Exception as e:
+            logger.error("[DLQ] Failed to reset idempotency markers: %s", e)
+            for _, pr_id, _ in pending:
+                details.append({
+                    "pr_id": pr_id,
+                    "status": "failed",
+                    "error": f"Failed to reset idempotency marker: {e}"
+                })
+            messages_failed += len(pending)
+            pending = []
+
+        # Pass 2: republish to main topic
+        for received_message, pr_id, commit_sha in pending:
+            try:
                 republish_message = {
                     "pr_id": pr_id,
                     "commit_sha": commit_sha,
@@ -1491,7 +2400,7 @@ def process_dead_letter_queue(request):
                     )
                     new_message_id = future.result(timeout=10)
 
-                logger.info(f"[DLQ] Republished PR #{pr_id} | new message_id={new_message_id} | {pub_elapsed():.0f}ms")
+                logger.info("[DLQ] Republished PR #%s | new message_id=%s | %.0fms", pr_id, new_message_id, pub_elapsed())
 
                 details.append({
                     "pr_id": pr_id,
@@ -1504,7 +2413,7 @@ def process_dead_letter_queue(request):
                 ack_ids.append(received_message.ack_id)
 
             except Exception as e:
-                logger.error(f"[DLQ] Failed to process message: {e}")
+                logger.error("[DLQ] Failed to process message: %s", e)
                 details.append({
                     "pr_id": pr_id,
                     "status": "failed",
@@ -1521,11 +2430,11 @@ def process_dead_letter_queue(request):
                         "ack_ids": ack_ids,
                     }
                 )
-                logger.info(f"[DLQ] Acknowledged {len(ack_ids)} messages")
+                logger.info("[DLQ] Acknowledged %s messages", len(ack_ids))
             except Exception as e:
-                logger.error(f"[DLQ] Failed to acknowledge messages: {e}")
+                logger.error("[DLQ] Failed to acknowledge messages: %s", e)
 
-        logger.info(f"[COMPLETE] DLQ processing finished | Pulled: {messages_pulled} | Republished: {messages_republished} | Failed: {messages_failed} | {elapsed():.0f}ms")
+        logger.info("[COMPLETE] DLQ processing finished | Pulled: %s | Republished: %s | Failed: %s | %.0fms", messages_pulled, messages_republished, messages_failed, elapsed())
         logger.info("=" * 60)
 
         return make_response({
@@ -1557,6 +2466,9 @@ def receive_webhook(request):
         }
 
     Response (202 Accepted):
+        A repeat of a recently published PR+commit is not republished and
+        returns status "duplicate_suppressed" with the original message_id.
+
         {
             "status": "queued",
             "message_id": "1234567890",
@@ -1571,7 +2483,7 @@ def receive_webhook(request):
         # Load minimal config (only need API_KEY and PUBSUB_TOPIC)
         config, missing = load_webhook_config()
         if missing:
-            logger.error(f"[CONFIG] Missing required environment variables: {missing}")
+            logger.error("[CONFIG] Missing required environment variables: %s", missing)
             return {"error": f"Server configuration error: missing {missing}"}, 500
         
         # Validate API key
@@ -1580,23 +2492,42 @@ def receive_webhook(request):
             logger.warning("[AUTH] Missing X-API-Key header")
             return {"error": "Missing X-API-Key header"}, 401
         
-        if api_key != config["API_KEY"]:
+        if not is_valid_api_key(api_key, config.api_key):
             logger.warning("[AUTH] Invalid API key")
             return {"error": "Invalid API key"}, 401
         
         logger.info("[AUTH] API key validated")
         
-        # Parse JSON body
+        # Parse JSON body - webhook payloads are tiny, so refuse anything large before
+        # reading it; the length check after the read covers bodies sent without
+        # a Content-Length header (chunked transfer encoding)
+        if request.content_length is not None and request.content_length > WEBHOOK_MAX_BODY_BYTES:
+            logger.error("[PARSE] Request body too large: Content-Length %s bytes", request.content_length)
+            return {"error": f"Request body exceeds {WEBHOOK_MAX_BODY_BYTES} bytes"}, 413
+        
+        raw_body = request.get_data(cache=False)
+        if len(raw_body) > WEBHOOK_MAX_BODY_BYTES:
+            logger.error("[PARSE] Request body too large: %s bytes", len(raw_body))
+            return {"error": f"Request body exceeds {WEBHOOK_MAX_BODY_BYTES} bytes"}, 413
+        
+        if not raw_body:
+            logger.error("[PARSE] Empty request body")
+            return {"error": "Empty request body"}, 400
+        
         try:
-            data = request.get_json(force=True)
-        except Exception as e:
-            logger.error(f"[PARSE] Invalid JSON body: {e}")
+            data = orjson.loads(raw_body)
+        except orjson.JSONDecodeError as e:  # Also raised for invalid UTF-8
+            logger.error("[PARSE] Invalid JSON body: %s", e)
             return {"error": "Invalid JSON body"}, 400
         
         if not data:
             logger.error("[PARSE] Empty request body")
             return {"error": "Empty request body"}, 400
         
+        if not isinstance(data, dict):
+            logger.error("[PARSE] JSON body is not an object: %s", type(data).__name__)
+            return {"error": "Request body must be a JSON object"}, 400
+        
         # Validate required fields
         pr_id = data.get("pr_id")
         commit_sha = data.get("commit_sha")
@@ -1609,45 +2540,57 @@ def receive_webhook(request):
             logger.error("[PARSE] Missing commit_sha in request")
             return {"error": "Missing required field: commit_sha"}, 400
         
-        # Validate types
-        try:
-            pr_id = int(pr_id)
-        except (ValueError, TypeError):
-            logger.error(f"[PARSE] Invalid pr_id: {pr_id}")
+        # Validate types (bool is an int subclass, so reject it explicitly)
+        is_int = isinstance(pr_id, int) and not isinstance(pr_id, bool)
+        is_digit_str = isinstance(pr_id, str) and pr_id.isdecimal()
+        if not (is_int or is_digit_str):
+            logger.error("[PARSE] Invalid pr_id: %s", pr_id)
             return {"error": "pr_id must be an integer"}, 400
+        pr_id = int(pr_id)
+        
+        if not isinstance(commit_sha, str) or not COMMIT_SHA_PATTERN.fullmatch(commit_sha):
+            logger.error("[PARSE] Invalid commit_sha: %s", commit_sha)
+            return {"error": "commit_sha must be a hex string of at least 7 characters"}, 400
         
-        if not isinstance(commit_sha, str) or len(commit_sha) < 7:
-            logger.error(f"[PARSE] Invalid commit_sha: {commit_sha}")
-            return {"error": "commit_sha must be a string of at least 7 characters"}, 400
+        logger.info("[WEBHOOK] PR #%s @ %s", pr_id, commit_sha[:8])
         
-        logger.info(f"[WEBHOOK] PR #{pr_id} @ {commit_sha[:8]}")
+        # Azure DevOps re-delivers on pipeline retries - don't republish within the window
+        recent_message_id = _get_recent_publish(pr_id, commit_sha)
+        if recent_message_id:
+            logger.info("[WEBHOOK] Duplicate delivery for PR #%s @ %s - reusing message %s", pr_id, commit_sha[:8], recent_message_id)
+            logger.info("=" * 60)
+            return {
+                "status": "duplicate_suppressed",
+                "message_id": recent_message_id,
+                "pr_id": pr_id,
+                "commit_sha": commit_sha[:8]
+            }, 202
         
         # Build Pub/Sub message
-        message = {
-            "pr_id": pr_id,
-            "commit_sha": commit_sha,
-            "received_at": datetime.now(timezone.utc).isoformat(),
-            "source": "azure-devops-pipeline"
-        }
+        # Millisecond precision is enough for tracing and skips microsecond formatting
+        received_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        message_bytes = build_webhook_message(pr_id, commit_sha, received_at)
         
-        # Publish to Pub/Sub
+        # Publish to Pub/Sub and wait for the ack before answering 202 - with
+        # request-based CPU, work left on background threads after the
+        # response may never run
         try:
-            publisher = pubsub_v1.PublisherClient()
-            topic_path = publisher.topic_path(config["VERTEX_PROJECT"], config["PUBSUB_TOPIC"])
-            
-            message_bytes = json.dumps(message).encode("utf-8")
+            publisher = _get_publisher()
+            topic_path = _get_topic_path(config.vertex_project, config.pubsub_topic)
             
             with timed_operation() as pubsub_elapsed:
                 future = publisher.publish(topic_path, message_bytes)
                 message_id = future.result(timeout=30)
             
-            logger.info(f"[PUBSUB] Published message {message_id} to {config['PUBSUB_TOPIC']} | {pubsub_elapsed():.0f}ms")
+            logger.info("[PUBSUB] Published message %s to %s | %.0fms", message_id, config.pubsub_topic, pubsub_elapsed())
+            # Only an acknowledged publish suppresses later deliveries
+            _record_publish(pr_id, commit_sha, message_id)
             
         except Exception as e:
-            logger.error(f"[PUBSUB] Failed to publish message: {e}")
+            logger.error("[PUBSUB] Failed to publish message: %s", e)
             return {"error": f"Failed to queue message: {str(e)}"}, 500
         
-        logger.info(f"[COMPLETE] Webhook processed | PR #{pr_id} queued | {elapsed():.0f}ms")
+        logger.info("[COMPLETE] Webhook processed | PR #%s queued | %.0fms", pr_id, elapsed())
         logger.info("=" * 60)
         
         return {
@@ -1656,3 +2599,46 @@ def receive_webhook(request):
             "pr_id": pr_id,
             "commit_sha": commit_sha[:8]
         }, 202
+
+
+# =============================================================================
+# Cold Start Warm-up
+# =============================================================================
+
+def _warm() -> None:
+    """Build the shared clients for this entry point during container boot.
+    
+    functions_framework imports the module before serving the first request,
+    so doing the expensive client setup here keeps it off request latency.
+    Only the clients used by FUNCTION_TARGET are built, and every failure is
+    logged and ignored - the request path creates anything still missing.
+    """
+    target = os.environ.get("FUNCTION_TARGET", "")
+    config, _ = load_config()
+    
+    steps = []
+    if target == "receive_webhook":
+        steps.append(("pubsub", _get_publisher))
+    if target in ("review_pr", "review_pr_pubsub"):
+        if config["GCS_BUCKET"]:
+            # A cheap object read opens the HTTP session before the first upload. It
+            # needs only storage.objects.get, which marker reads already require;
+            # bucket.exists() would need storage.buckets.get as well.
+            steps.append(("gcs", lambda: _get_bucket(config["GCS_BUCKET"]).get_blob(
+                "idempotency/warm-up.json", timeout=GCS_TIMEOUT_SECONDS
+            )))
+        if config["VERTEX_PROJECT"]:
+            steps.append(("gemini", lambda: _get_genai_client(config["VERTEX_PROJECT"], config["VERTEX_LOCATION"])))
+    
+    for name, step in steps:
+        with timed_operation() as elapsed:
+            try:
+                step()
+                logger.info("[WARM] %s client ready | %.0fms", name, elapsed())
+            except Exception as e:
+                logger.warning("[WARM] %s warm-up failed (will retry on first request): %s", name, e)
+
+
+# K_SERVICE is only set when running on Cloud Functions / Cloud Run
+if os.environ.get("K_SERVICE"):
+    _warm()
@@ -3,16 +3,28 @@
 Run with: pytest test_main.py -v
 """
 
+import base64
+import gzip
+import json
+import threading
+import time
+from datetime import datetime
+
 import pytest
+import requests
 from unittest.mock import MagicMock, patch
 
 from google.api_core.exceptions import PreconditionFailed
 
+import main
 from main import (
     AzureDevOpsClient,
     save_to_storage,
     get_max_severity,
     build_review_prompt,
+    build_unified_diff,
+    is_whitespace_only,
+    needs_review,
     check_and_claim_processing,
     update_marker_completed,
     update_marker_for_retry,
@@ -20,7 +32,13 @@ from main import (
     MAX_RETRY_ATTEMPTS,
     load_webhook_config,
     receive_webhook,
+    build_webhook_message,
     process_pr_review,
+    call_gemini,
+    is_valid_api_key,
+    review_pr,
+    review_pr_pubsub,
+    PRNotReadyError,
     ReviewResult,
 )
 
@@ -29,18 +47,36 @@ from main import (
 # Fixtures
 # =============================================================================
 
+@pytest.fixture(autouse=True)
+def reset_module_clients(monkeypatch):
+    """Clear module-level client singletons so each test builds its own mocks."""
+    monkeypatch.setattr(main, "_GENAI_CLIENT", None)
+    monkeypatch.setattr(main, "_GCS_CLIENT", None)
+    monkeypatch.setattr(main, "_GCS_BUCKETS", {})
+    monkeypatch.setattr(main, "_PUBLISHER", None)
+    monkeypatch.setattr(main, "_WEBHOOK_DEDUP", {})
+    monkeypatch.setattr(main, "_TOPIC_PATHS", {})
+    monkeypatch.setattr(main, "_WEBHOOK_CONFIG", None)
+    monkeypatch.setattr(main, "_LLM_RESPONSES", {})
+    monkeypatch.setattr(main, "_ADO_CLIENTS", {})
+    monkeypatch.setattr(main, "_COMPLETED_MARKERS", main.OrderedDict())
+    main._FILE_CONTENT_CACHE.clear()
+
+
 @pytest.fixture
 def ado_client():
-    """Create an AzureDevOpsClient instance for testing."""
-    return AzureDevOpsClient(
+    """Create an AzureDevOpsClient instance for testing, closed afterwards."""
+    with AzureDevOpsClient(
         org="test-org",
         project="test-project",
         repo="test-repo",
         pat="fake-pat-token",
-    )
+    ) as client:
+        yield client
 
 
-@pytest.fixture
+# Read-only samples are built once per module; tests that need a variant copy them
+@pytest.fixture(scope="module")
 def sample_pr():
     """Sample PR metadata response."""
     return {
@@ -55,7 +91,7 @@ def sample_pr():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def sample_file_diffs():
     """Sample file diffs for prompt building."""
     return [
@@ -267,6 +303,125 @@ Just a note."""
         assert result.storage_path == "gs://my-bucket/reviews/path.md"
 
 
+# =============================================================================
+# Gemini Tests
+# =============================================================================
+
+class TestCallGemini:
+    """Tests for call_gemini function."""
+
+    def test_call_gemini_reuses_client(self, mocker):
+        """call_gemini builds the GenAI client once and reuses it across calls."""
+        config = {
+            "GEMINI_MODEL": "gemini-test",
+            "VERTEX_PROJECT": "test-project",
+            "VERTEX_LOCATION": "us-central1",
+        }
+        mock_client = MagicMock()
+        mock_client.models.generate_content.return_value.text = "# Review"
+        mock_factory = mocker.patch("main.genai.Client", return_value=mock_client)
+
+        assert call_gemini(config, "prompt one") == "# Review"
+        assert call_gemini(config, "prompt two") == "# Review"
+
+        mock_factory.assert_called_once_with(
+            vertexai=True, project="test-project", location="us-central1"
+        )
+        call_kwargs = mock_client.models.generate_content.call_args[1]
+        assert call_kwargs["config"] is main.GENERATION_CONFIG
+
+    def test_call_gemini_caches_identical_prompts(self, mocker):
+        """An identical prompt is answered from the in-process cache."""
+        config = {
+            "GEMINI_MODEL": "gemini-test",
+            "VERTEX_PROJECT": "test-project",
+            "VERTEX_LOCATION": "us-central1",
+        }
+        mock_client = MagicMock()
+        mock_client.models.generate_content.return_value.text = "# Review"
+        mocker.patch("main.genai.Client", return_value=mock_client)
+
+        assert call_gemini(config, "same prompt") == "# Review"
+        assert call_gemini(config, "same prompt") == "# Review"
+
+        mock_client.models.generate_content.assert_called_once()
+
+    def test_call_gemini_uses_gcs_cache(self, mocker):
+        """A review cached in GCS by another instance skips generation."""
+        config = {
+            "GEMINI_MODEL": "gemini-test",
+            "VERTEX_PROJECT": "test-project",
+            "VERTEX_LOCATION": "us-central1",
+            "GCS_BUCKET": "test-bucket",
+        }
+        mock_blob = MagicMock()
+        mock_blob.download_as_text.return_value = "# Cached review"
+        mock_client = MagicMock()
+        mock_client.bucket.return_value.blob.return_value = mock_blob
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        mock_genai = mocker.patch("main.genai.Client")
+
+        assert call_gemini(config, "prompt") == "# Cached review"
+
+        key = main.llm_cache_key("gemini-test", "prompt")
+        mock_client.bucket.return_value.blob.assert_called_once_with(f"llm-cache/{key}.md")
+        mock_genai.assert_not_called()
+
+    def test_cache_key_covers_generation_settings(self, mocker):
+        """Changing temperature or max_output_tokens changes the cache key."""
+        key = main.llm_cache_key("gemini-test", "prompt")
+        
+        for setting in ("temperature", "max_output_tokens"):
+            changed = main.GENERATION_CONFIG.model_copy(update={setting: 1})
+            mocker.patch("main._GENERATION_CONFIG_FINGERPRINT", changed.model_dump_json(exclude_none=True))
+            assert main.llm_cache_key("gemini-test", "prompt") != key
+        
+        assert '"temperature":0.2' in main._GENERATION_CONFIG_FINGERPRINT
+
+    def test_memory_cache_survives_concurrent_writers(self):
+        """Concurrent evictions neither raise nor overfill the in-process cache."""
+        errors = []
+        
+        def writer(worker):
+            try:
+                for i in range(500):
+                    main._remember_response(f"{worker}-{i}", "review")
+            except Exception as e:  # pragma: no cover - only on a race
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert len(main._LLM_RESPONSES) <= main.LLM_MEMORY_CACHE_MAX_ENTRIES
+
+    def test_call_gemini_writes_through_on_miss(self, mocker):
+        """A freshly generated review is written to the GCS cache."""
+        config = {
+            "GEMINI_MODEL": "gemini-test",
+            "VERTEX_PROJECT": "test-project",
+            "VERTEX_LOCATION": "us-central1",
+            "GCS_BUCKET": "test-bucket",
+        }
+        mock_blob = MagicMock()
+        mock_blob.download_as_text.side_effect = main.NotFound("missing")
+        mock_storage = MagicMock()
+        mock_storage.bucket.return_value.blob.return_value = mock_blob
+        mocker.patch("main.storage.Client", return_value=mock_storage)
+        mock_client = MagicMock()
+        mock_client.models.generate_content.return_value.text = "# Fresh review"
+        mocker.patch("main.genai.Client", return_value=mock_client)
+
+        assert call_gemini(config, "prompt") == "# Fresh review"
+
+        upload_args = mock_blob.upload_from_string.call_args
+        assert upload_args[0][0] == "# Fresh review"
+        assert upload_args[1]["if_generation_match"] == 0
+
+
 # =============================================================================
 # AzureDevOpsClient Tests
 # =============================================================================
@@ -278,9 +433,9 @@ class TestAzureDevOpsClientRequest:
         """GET request returns JSON response."""
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"id": 1, "name": "test"}
+        mock_response.content = b'{"id": 1, "name": "test"}'
         
-        mock_request = mocker.patch("main.requests.request", return_value=mock_response)
+        mock_request = mocker.patch.object(ado_client._session, "request", return_value=mock_response)
         
         result = ado_client._get("/test/endpoint")
         
@@ -294,9 +449,9 @@ class TestAzureDevOpsClientRequest:
         """POST request sends payload and returns JSON."""
         mock_response = MagicMock()
         mock_response.status_code = 201
-        mock_response.json.return_value = {"created": True}
+        mock_response.content = b'{"created": true}'
         
-        mock_request = mocker.patch("main.requests.request", return_value=mock_response)
+        mock_request = mocker.patch.object(ado_client._session, "request", return_value=mock_response)
         
         payload = {"content": "test data"}
         result = ado_client._post("/test/endpoint", payload)
@@ -304,16 +459,29 @@ class TestAzureDevOpsClientRequest:
         mock_request.assert_called_once()
         call_args = mock_request.call_args
         assert call_args[0][0] == "POST"
-        assert call_args[1]["json"] == payload
+        assert json.loads(call_args[1]["data"]) == payload
         assert result == {"created": True}
 
+    def test_request_body_is_compact_json(self, ado_client, mocker):
+        """POST bodies are sent as compact UTF-8 JSON bytes with a JSON content type."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = b'{}'
+        mock_request = mocker.patch.object(ado_client._session, "request", return_value=mock_response)
+        
+        ado_client._post("/test/endpoint", {"content": "caf\u00e9 review", "status": 1})
+        
+        call_kwargs = mock_request.call_args[1]
+        assert call_kwargs["data"] == '{"content":"caf\u00e9 review","status":1}'.encode("utf-8")
+        assert call_kwargs["headers"]["Content-Type"] == "application/json"
+
     def test_request_put_success(self, ado_client, mocker):
         """PUT request sends payload and returns JSON."""
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"updated": True}
+        mock_response.content = b'{"updated": true}'
         
-        mock_request = mocker.patch("main.requests.request", return_value=mock_response)
+        mock_request = mocker.patch.object(ado_client._session, "request", return_value=mock_response)
         
         payload = {"vote": -10}
         result = ado_client._put("/test/endpoint", payload)
@@ -321,9 +489,188 @@ class TestAzureDevOpsClientRequest:
         mock_request.assert_called_once()
         call_args = mock_request.call_args
         assert call_args[0][0] == "PUT"
-        assert call_args[1]["json"] == payload
+        assert json.loads(call_args[1]["data"]) == payload
         assert result == {"updated": True}
 
+    def test_request_goes_through_pooled_adapter(self, ado_client, mocker):
+        """Requests are prepared by the real session and sent on its mounted adapter."""
+        sent = []
+        
+        def send(prepared, **kwargs):
+            sent.append(prepared)
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"id": 1}'
+            response.request = prepared
+            response.url = prepared.url
+            return response
+        
+        adapter = ado_client._session.get_adapter("https://dev.azure.com/")
+        mocker.patch.object(adapter, "send", side_effect=send)
+        
+        assert ado_client._get("/test/endpoint") == {"id": 1}
+        
+        assert len(sent) == 1
+        assert sent[0].headers["Connection"] == "keep-alive"
+        assert sent[0].headers["Authorization"].startswith("Basic ")
+        assert "api-version=" in sent[0].url
+
+
+class TestAzureDevOpsClientSession:
+    """Tests for AzureDevOpsClient HTTP session reuse."""
+
+    def test_session_carries_auth(self, ado_client):
+        """The shared session authenticates with the PAT via basic auth."""
+        assert ado_client._session.auth == ("", "fake-pat-token")
+
+    def test_requests_share_one_session(self, ado_client, mocker):
+        """Consecutive API calls go through the same session."""
+        mock_response = MagicMock()
+        mock_response.content = b'{}'
+        mock_request = mocker.patch.object(ado_client._session, "request", return_value=mock_response)
+        
+        ado_client._get("/first")
+        ado_client._get("/second")
+        
+        assert mock_request.call_count == 2
+
+    def test_session_retries_transient_errors(self, ado_client):
+        """Throttling and 5xx responses are retried for idempotent methods only."""
+        retry = ado_client._session.get_adapter("https://dev.azure.com").max_retries
+        
+        assert retry.total == 5
+        assert 429 in retry.status_forcelist
+        assert 503 in retry.status_forcelist
+        assert retry.is_retry("GET", 503)
+        assert retry.is_retry("PUT", 429)
+        assert not retry.is_retry("POST", 503)
+        assert not retry.is_retry("GET", 404)
+
+    def test_close_closes_session(self, ado_client, mocker):
+        """close() releases the session's pooled connections."""
+        mock_close = mocker.patch.object(ado_client._session, "close")
+        
+        ado_client.close()
+        
+        mock_close.assert_called_once()
+
+    def test_close_shuts_down_fetch_pool(self, ado_client, mocker):
+        """close() also stops the client's fetch thread pool."""
+        mock_shutdown = mocker.patch.object(ado_client._executor, "shutdown")
+        
+        ado_client.close()
+        
+        mock_shutdown.assert_called_once()
+
+    def test_context_manager_closes(self, ado_client, mocker):
+        """Leaving a with-block closes the client."""
+        mock_close = mocker.patch.object(ado_client, "close")
+        
+        with ado_client as client:
+            assert client is ado_client
+        
+        mock_close.assert_called_once()
+
+
+class TestGetAdoClient:
+    """Tests for the shared AzureDevOpsClient cache."""
+
+    @staticmethod
+    def _config(**overrides):
+        config = {
+            "AZURE_DEVOPS_ORG": "test-org",
+            "AZURE_DEVOPS_PROJECT": "test-project",
+            "AZURE_DEVOPS_REPO": "test-repo",
+            "AZURE_DEVOPS_PAT": "fake-pat-token",
+        }
+        config.update(overrides)
+        return config
+
+    def test_reuses_client_for_same_repo(self):
+        """Repeated calls with the same settings return the same client."""
+        first = main._get_ado_client(self._config())
+        
+        assert main._get_ado_client(self._config()) is first
+        assert first.repo == "test-repo"
+
+    def test_new_client_for_different_repo(self):
+        """A different repository gets its own client; the first stays cached."""
+        first = main._get_ado_client(self._config())
+        
+        assert main._get_ado_client(self._config(AZURE_DEVOPS_REPO="other-repo")) is not first
+        assert main._get_ado_client(self._config()) is first
+
+    def test_rotated_pat_replaces_client_without_closing_it(self, mocker):
+        """A rotated PAT replaces the cached client; the old one stays usable."""
+        first = main._get_ado_client(self._config())
+        close = mocker.patch.object(first, "close")
+        
+        second = main._get_ado_client(self._config(AZURE_DEVOPS_PAT="rotated"))
+        
+        assert second is not first
+        close.assert_not_called()
+        assert len(main._ADO_CLIENTS) == 1
+        assert main._get_ado_client(self._config(AZURE_DEVOPS_PAT="rotated")) is second
+
+    def test_concurrent_cold_callers_share_one_client(self, mocker):
+        """Racing first calls build a single client instead of leaking extras."""
+        def slow_client(**kwargs):
+            time.sleep(0.01)  # Widen the window between lookup and insert
+            return MagicMock()
+        
+        mock_factory = mocker.patch("main.AzureDevOpsClient", side_effect=slow_client)
+        start = threading.Barrier(8, timeout=5)
+        results = []
+        
+        def worker():
+            start.wait()
+            results.append(main._get_ado_client(self._config()))
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        mock_factory.assert_called_once()
+        assert all(client is results[0] for client in results)
+
+    def test_rotation_does_not_break_in_flight_request(self, mocker):
+        """A request still using the old client keeps working after a PAT rotation."""
+        old_client = main._get_ado_client(self._config())
+        mocker.patch.object(old_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/src/a.js"}, "changeType": "edit"},
+        ])
+        mocker.patch.object(old_client, "get_file_content", return_value="code();")
+        in_flight = threading.Event()
+        rotated = threading.Event()
+        errors = []
+        
+        def in_flight_request():
+            client = main._get_ado_client(self._config())
+            in_flight.set()
+            assert rotated.wait(timeout=5)
+            try:
+                # Fans out on the client's executor, which must still be running
+                client.get_pr_diff(12345, pr={"lastMergeSourceCommit": {"commitId": "a"},
+                                              "lastMergeTargetCommit": {"commitId": "b"}})
+            except Exception as e:  # pragma: no cover - only if the client was closed
+                errors.append(e)
+        
+        def rotating_request():
+            assert in_flight.wait(timeout=5)
+            main._get_ado_client(self._config(AZURE_DEVOPS_PAT="rotated"))
+            rotated.set()
+        
+        threads = [threading.Thread(target=in_flight_request), threading.Thread(target=rotating_request)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert main._get_ado_client(self._config(AZURE_DEVOPS_PAT="rotated")) is not old_client
+
 
 class TestAzureDevOpsClientMethods:
     """Tests for AzureDevOpsClient high-level methods."""
@@ -342,14 +689,100 @@ class TestAzureDevOpsClientMethods:
         """get_file_content fetches file at specific commit."""
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.text = "file content here"
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = [b"file content here"]
+        mock_response.__enter__.return_value = mock_response
         
-        mocker.patch("main.requests.get", return_value=mock_response)
+        mocker.patch.object(ado_client._session, "get", return_value=mock_response)
         
         result = ado_client.get_file_content("/src/file.js", "abc123")
         
         assert result == "file content here"
 
+    def test_get_file_content_decodes_split_characters(self, ado_client, mocker):
+        """Multi-byte characters split across stream chunks decode correctly."""
+        mock_response = MagicMock()
+        mock_response.encoding = None
+        mock_response.iter_content.return_value = ["é".encode()[:1], "é".encode()[1:] + b"!"]
+        mock_response.__enter__.return_value = mock_response
+        mocker.patch.object(ado_client._session, "get", return_value=mock_response)
+        
+        assert ado_client.get_file_content("/src/file.js", "abc123") == "é!"
+
+    def test_get_file_content_stops_reading_oversized(self, ado_client, mocker):
+        """Reading stops once the content passes max_chars, and it is not cached."""
+        chunks = [b"a" * 10, b"b" * 10, b"c" * 10]
+        mock_response = MagicMock()
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = iter(chunks)
+        mock_response.__enter__.return_value = mock_response
+        mock_get = mocker.patch.object(ado_client._session, "get", return_value=mock_response)
+        
+        result = ado_client.get_file_content("/src/big.js", "abc123", max_chars=15)
+        
+        assert result == "a" * 10 + "b" * 10
+        assert mock_get.call_args.kwargs["stream"] is True
+        assert ado_client._content_cache.get(
+            (ado_client.base_url, ado_client.repo, "/src/big.js", "abc123")
+        ) is main.CACHE_MISS
+
+    def test_get_file_content_not_found(self, ado_client, mocker):
+        """A 404 returns None without reading the body."""
+        error_response = MagicMock(status_code=404)
+        mock_response = MagicMock()
+        mock_response.raise_for_status.side_effect = requests.HTTPError(response=error_response)
+        mock_response.__enter__.return_value = mock_response
+        mocker.patch.object(ado_client._session, "get", return_value=mock_response)
+        
+        assert ado_client.get_file_content("/src/missing.js", "abc123") is None
+        mock_response.iter_content.assert_not_called()
+
+    def test_get_file_content_cached(self, ado_client, mocker):
+        """get_file_content fetches each (path, commit) pair only once."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = [b"file content here"]
+        mock_response.__enter__.return_value = mock_response
+        
+        mock_get = mocker.patch.object(ado_client._session, "get", return_value=mock_response)
+        
+        first = ado_client.get_file_content("/src/file.js", "abc123")
+        second = ado_client.get_file_content("/src/file.js", "abc123")
+        other_commit = ado_client.get_file_content("/src/file.js", "def456")
+        
+        assert first == second == other_commit == "file content here"
+        assert mock_get.call_count == 2
+
+    def test_get_file_content_cache_shared_across_clients(self, ado_client, mocker):
+        """A second client for the same repo reuses content fetched by the first."""
+        mock_response = MagicMock()
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = [b"file content here"]
+        mock_response.__enter__.return_value = mock_response
+        mocker.patch.object(ado_client._session, "get", return_value=mock_response)
+        ado_client.get_file_content("/src/file.js", "abc123")
+        
+        other_client = AzureDevOpsClient("test-org", "test-project", "test-repo", "fake-pat-token")
+        other_get = mocker.patch.object(other_client._session, "get")
+        
+        assert other_client.get_file_content("/src/file.js", "abc123") == "file content here"
+        other_get.assert_not_called()
+
+    def test_get_pr_changes_pages_large_iterations(self, ado_client, mocker):
+        """Change entries are listed in API-maximum pages until nextSkipId runs out."""
+        mock_get = mocker.patch.object(ado_client, "_get", side_effect=[
+            {"changeEntries": [{"changeTrackingId": 1}], "nextSkipId": 2000, "nextTopId": 2000},
+            {"changeEntries": [{"changeTrackingId": 2}], "nextSkipId": 0, "nextTopId": 0},
+        ])
+        
+        changes = ado_client.get_pr_changes(12345, iteration_id=3)
+        
+        assert [c["changeTrackingId"] for c in changes] == [1, 2]
+        assert mock_get.call_count == 2
+        assert mock_get.call_args_list[0][1]["params"] == {"$top": main.PR_CHANGES_PAGE_SIZE, "$skip": 0}
+        assert mock_get.call_args_list[1][1]["params"]["$skip"] == 2000
+
     def test_get_pr_diff(self, ado_client, sample_pr, mocker):
         """get_pr_diff aggregates file contents from source and target."""
         mocker.patch.object(ado_client, "get_pull_request", return_value=sample_pr)
@@ -359,10 +792,12 @@ class TestAzureDevOpsClientMethods:
                 "changeType": "edit",
             }
         ])
+        # Fetches run concurrently, so answer by commit rather than call order
+        contents = {"abc123def456": "new content", "789xyz000111": "old content"}
         mocker.patch.object(
             ado_client, 
             "get_file_content", 
-            side_effect=["new content", "old content"]
+            side_effect=lambda path, commit_id: contents[commit_id]
         )
         
         result = ado_client.get_pr_diff(12345)
@@ -373,6 +808,237 @@ class TestAzureDevOpsClientMethods:
         assert result[0]["source_content"] == "new content"
         assert result[0]["target_content"] == "old content"
 
+    def test_get_pr_diff_fetches_metadata_and_changes_together(self, ado_client, sample_pr, mocker):
+        """get_pr_diff lists changes while PR metadata is still in flight."""
+        changes_started = threading.Event()
+        
+        def slow_get_pull_request(pr_id):
+            # Only returns once the change listing has started on another thread
+            assert changes_started.wait(timeout=5)
+            return sample_pr
+        
+        def get_pr_changes(pr_id):
+            changes_started.set()
+            return []
+        
+        mocker.patch.object(ado_client, "get_pull_request", side_effect=slow_get_pull_request)
+        mocker.patch.object(ado_client, "get_pr_changes", side_effect=get_pr_changes)
+        
+        assert ado_client.get_pr_diff(12345) == []
+
+    def test_get_pr_diff_fetches_both_sides_concurrently(self, ado_client, sample_pr, mocker):
+        """Source and target versions of a file are fetched in parallel."""
+        # Each fetch only returns once both sides are in flight
+        both_started = threading.Barrier(2, timeout=5)
+        
+        def get_file_content(path, commit_id):
+            both_started.wait()
+            return f"{path}@{commit_id}"
+        
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/src/a.js"}, "changeType": "edit"}
+        ])
+        mocker.patch.object(ado_client, "get_file_content", side_effect=get_file_content)
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        assert result[0]["source_content"].endswith(sample_pr["lastMergeSourceCommit"]["commitId"])
+        assert result[0]["target_content"].endswith(sample_pr["lastMergeTargetCommit"]["commitId"])
+
+    def test_get_pr_diff_preserves_change_order(self, ado_client, sample_pr, mocker):
+        """get_pr_diff returns files in change order and skips folders."""
+        mocker.patch.object(ado_client, "get_pull_request", return_value=sample_pr)
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": f"/src/file{i}.js"}, "changeType": "edit"} for i in range(20)
+        ] + [{"item": {"path": "/src", "isFolder": True}, "changeType": "edit"}])
+        mocker.patch.object(
+            ado_client,
+            "get_file_content",
+            side_effect=lambda path, commit_id: f"{path}@{commit_id}"
+        )
+        
+        result = ado_client.get_pr_diff(12345)
+        
+        assert [diff["path"] for diff in result] == [f"/src/file{i}.js" for i in range(20)]
+        assert result[3]["source_content"] == "/src/file3.js@abc123def456"
+        assert result[3]["target_content"] == "/src/file3.js@789xyz000111"
+
+    def test_get_pr_diff_skips_binary_assets(self, ado_client, sample_pr, mocker):
+        """Binary and minified files are listed but never downloaded."""
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/img/logo.png"}, "changeType": "add"},
+            {"item": {"path": "/dist/app.min.js"}, "changeType": "edit"},
+            {"item": {"path": "/doc/spec.bin", "contentMetadata": {"isBinary": True}}, "changeType": "edit"},
+        ])
+        get_content = mocker.patch.object(ado_client, "get_file_content")
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        get_content.assert_not_called()
+        assert [diff["skip_reason"] for diff in result] == [
+            "binary or minified asset",
+            "binary or minified asset",
+            "binary file",
+        ]
+
+    def test_get_pr_diff_reviews_svg_files(self, ado_client, sample_pr, mocker):
+        """SVG is text that can embed scripts, so it is downloaded and reviewed."""
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/img/icon.svg"}, "changeType": "edit"},
+        ])
+        get_content = mocker.patch.object(ado_client, "get_file_content", return_value="<svg></svg>")
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        assert get_content.call_count == 2
+        assert result[0]["skip_reason"] is None
+        assert result[0]["target_content"] == "<svg></svg>"
+
+    def test_get_pr_diff_skips_generated_files(self, ado_client, sample_pr, mocker):
+        """Lockfiles, snapshots and source maps are listed but never downloaded."""
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/package-lock.json"}, "changeType": "edit"},
+            {"item": {"path": "/api/Poetry.lock"}, "changeType": "edit"},
+            {"item": {"path": "/src/__snapshots__/app.test.js.snap"}, "changeType": "edit"},
+            {"item": {"path": "/dist/app.js.map"}, "changeType": "add"},
+        ])
+        get_content = mocker.patch.object(ado_client, "get_file_content")
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        get_content.assert_not_called()
+        assert {diff["skip_reason"] for diff in result} == {"generated file"}
+
+    def test_get_pr_diff_drops_oversized_content(self, ado_client, sample_pr, mocker):
+        """Files larger than MAX_REVIEW_FILE_CHARS are not passed on to the prompt."""
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/src/generated.js"}, "changeType": "edit"},
+        ])
+        mocker.patch.object(
+            ado_client, "get_file_content", return_value="x" * (main.MAX_REVIEW_FILE_CHARS + 1)
+        )
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        assert result[0]["source_content"] is None
+        assert result[0]["target_content"] is None
+        assert result[0]["skip_reason"].startswith("large file")
+
+    def test_get_pr_diff_fetches_one_side_for_add_and_delete(self, ado_client, sample_pr, mocker):
+        """Added files skip the target fetch and deleted files skip the source fetch."""
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/src/new.js"}, "changeType": "add"},
+            {"item": {"path": "/src/old.js"}, "changeType": "delete"},
+        ])
+        get_content = mocker.patch.object(
+            ado_client, "get_file_content", side_effect=lambda path, commit_id: f"{path}@{commit_id}"
+        )
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        assert sorted(call.args for call in get_content.call_args_list) == [
+            ("/src/new.js", "abc123def456"),
+            ("/src/old.js", "789xyz000111"),
+        ]
+        assert result[0]["target_content"] is None
+        assert result[1]["source_content"] is None
+
+    def test_get_pr_diff_fails_fast_without_merge_commits(self, ado_client, sample_pr, mocker):
+        """A PR without merge commits raises before any change listing."""
+        pr = {key: value for key, value in sample_pr.items() if key != "lastMergeTargetCommit"}
+        get_changes = mocker.patch.object(ado_client, "get_pr_changes")
+        
+        with pytest.raises(main.PRNotReadyError):
+            ado_client.get_pr_diff(12345, pr=pr)
+        
+        get_changes.assert_not_called()
+
+    def test_get_pr_diff_reuses_prefetched_pr(self, ado_client, sample_pr, mocker):
+        """get_pr_diff does not re-fetch PR metadata the caller already has."""
+        get_pr = mocker.patch.object(ado_client, "get_pull_request")
+        mocker.patch.object(ado_client, "get_pr_changes", return_value=[
+            {"item": {"path": "/src/a.js"}, "changeType": "edit"}
+        ])
+        mocker.patch.object(ado_client, "get_file_content", return_value="content")
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr)
+        
+        assert len(result) == 1
+        get_pr.assert_not_called()
+
+    def test_get_pull_request_with_changes_fetches_together(self, ado_client, sample_pr, mocker):
+        """PR metadata and the change list are fetched concurrently."""
+        both_started = threading.Barrier(2, timeout=5)
+        changes = [{"item": {"path": "/src/a.js"}, "changeType": "edit"}]
+        
+        def get_pull_request(pr_id):
+            both_started.wait()
+            return sample_pr
+        
+        def get_pr_changes(pr_id):
+            both_started.wait()
+            return changes
+        
+        mocker.patch.object(ado_client, "get_pull_request", side_effect=get_pull_request)
+        mocker.patch.object(ado_client, "get_pr_changes", side_effect=get_pr_changes)
+        
+        assert ado_client.get_pull_request_with_changes(12345) == (sample_pr, changes)
+
+    def test_get_pr_diff_reuses_prefetched_changes(self, ado_client, sample_pr, mocker):
+        """get_pr_diff does not re-list changes the caller already has."""
+        get_changes = mocker.patch.object(ado_client, "get_pr_changes")
+        mocker.patch.object(ado_client, "get_file_content", return_value="content")
+        
+        result = ado_client.get_pr_diff(12345, pr=sample_pr, changes=[
+            {"item": {"path": "/src/a.js"}, "changeType": "edit"}
+        ])
+        
+        assert [diff["path"] for diff in result] == ["/src/a.js"]
+        get_changes.assert_not_called()
+
+
+class TestFileContentCache:
+    """Tests for FileContentCache."""
+
+    def test_get_returns_miss_for_unknown_key(self):
+        """Unknown keys return the CACHE_MISS sentinel, not None."""
+        cache = main.FileContentCache(max_total_chars=100, max_entry_chars=10)
+        assert cache.get(("a",)) is main.CACHE_MISS
+
+    def test_caches_not_found(self):
+        """A cached None (file not found) is distinguishable from a miss."""
+        cache = main.FileContentCache(max_total_chars=100, max_entry_chars=10)
+        cache.put(("a",), None)
+        assert cache.get(("a",)) is None
+
+    def test_skips_oversized_entries(self):
+        """Content over the per-entry limit is not cached."""
+        cache = main.FileContentCache(max_total_chars=100, max_entry_chars=10)
+        cache.put(("big",), "x" * 11)
+        assert cache.get(("big",)) is main.CACHE_MISS
+
+    def test_evicts_oldest_when_full(self):
+        """Oldest entries are evicted to stay within the total size limit."""
+        cache = main.FileContentCache(max_total_chars=20, max_entry_chars=10)
+        cache.put(("first",), "a" * 10)
+        cache.put(("second",), "b" * 10)
+        cache.put(("third",), "c" * 10)
+        
+        assert cache.get(("first",)) is main.CACHE_MISS
+        assert cache.get(("second",)) == "b" * 10
+        assert cache.get(("third",)) == "c" * 10
+
+    def test_reads_keep_entries_cached(self):
+        """A recently read entry outlives older unread ones (LRU, not FIFO)."""
+        cache = main.FileContentCache(max_total_chars=20, max_entry_chars=10)
+        cache.put(("first",), "a" * 10)
+        cache.put(("second",), "b" * 10)
+        cache.get(("first",))
+        cache.put(("third",), "c" * 10)
+        
+        assert cache.get(("first",)) == "a" * 10
+        assert cache.get(("second",)) is main.CACHE_MISS
+
 
 # =============================================================================
 # Cloud Storage Tests
@@ -404,15 +1070,56 @@ class TestSaveToStorage:
         assert "pr-12345" in blob_call
         assert blob_call.endswith("-review.md")
         
-        # Verify upload was called
+        # Verify upload was called with gzipped bytes and a create-only precondition
         mock_blob.upload_from_string.assert_called_once_with(
-            review_content, 
-            content_type="text/markdown"
+            mocker.ANY,
+            content_type="text/markdown; charset=utf-8",
+            if_generation_match=0,
+            timeout=main.GCS_TIMEOUT_SECONDS,
         )
+        uploaded = mock_blob.upload_from_string.call_args[0][0]
+        assert gzip.decompress(uploaded).decode("utf-8") == review_content
+        assert mock_blob.content_encoding == "gzip"
         
         # Verify return path format
         assert result.startswith("gs://test-bucket/reviews/")
 
+    def test_save_to_storage_blob_path(self, mocker):
+        """The blob path is partitioned by the UTC date and timestamped."""
+        mock_datetime = mocker.patch("main.datetime")
+        mock_datetime.now.return_value = datetime(2026, 1, 2, 3, 4, 5, 678)
+        mock_client = MagicMock()
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        result = save_to_storage("test-bucket", 42, "# Review")
+        
+        assert result == "gs://test-bucket/reviews/2026/01/02/pr-42-030405-000678-review.md"
+
+    def test_save_to_storage_same_second_paths_differ(self, mocker):
+        """Two reviews of one PR within the same second get distinct blob paths."""
+        mock_datetime = mocker.patch("main.datetime")
+        mock_datetime.now.side_effect = [
+            datetime(2026, 1, 2, 3, 4, 5, 100),
+            datetime(2026, 1, 2, 3, 4, 5, 200),
+        ]
+        mocker.patch("main.storage.Client", return_value=MagicMock())
+        
+        first = save_to_storage("test-bucket", 42, "# Review")
+        second = save_to_storage("test-bucket", 42, "# Review")
+        
+        assert first != second
+
+    def test_save_to_storage_reuses_client_and_bucket(self, mocker):
+        """save_to_storage builds the storage client and bucket handle once."""
+        mock_client = MagicMock()
+        mock_factory = mocker.patch("main.storage.Client", return_value=mock_client)
+
+        save_to_storage("test-bucket", 1, "# First")
+        save_to_storage("test-bucket", 2, "# Second")
+
+        mock_factory.assert_called_once()
+        mock_client.bucket.assert_called_once_with("test-bucket")
+
 
 # =============================================================================
 # Pure Logic Tests
@@ -470,11 +1177,50 @@ class TestGetMaxSeverity:
         """
         assert get_max_severity(review) == "action-required"
 
+    def test_get_max_severity_tolerates_case_and_spacing(self):
+        """Labels are matched regardless of case or extra spaces after the colon."""
+        review = "**Priority:**  Review-Recommended\n**Priority:** note"
+        assert get_max_severity(review) == "review-recommended"
+
     def test_get_max_severity_empty_review(self):
         """Returns 'note' for empty review."""
         assert get_max_severity("") == "note"
 
 
+class TestBuildUnifiedDiff:
+    """Tests for build_unified_diff function."""
+
+    def test_identical_content_is_empty(self):
+        """Returns an empty string when nothing changed."""
+        assert build_unified_diff("/a.js", "same\n", "same\n") == ""
+
+    def test_diff_headers_and_lines(self):
+        """Marks removed target lines with - and added source lines with +."""
+        diff = build_unified_diff("/a.js", "old line", "new line")
+        
+        assert diff.startswith("--- a/a.js\n+++ b/a.js")
+        assert "-old line" in diff
+        assert "+new line" in diff
+
+
+class TestIsValidApiKey:
+    """Tests for is_valid_api_key function."""
+
+    def test_matching_key(self):
+        """Returns True when the provided key matches."""
+        assert is_valid_api_key("secret-key", "secret-key") is True
+
+    def test_mismatched_key(self):
+        """Returns False when the provided key differs."""
+        assert is_valid_api_key("wrong-key", "secret-key") is False
+
+    def test_missing_key(self):
+        """Returns False when either key is missing or empty."""
+        assert is_valid_api_key(None, "secret-key") is False
+        assert is_valid_api_key("", "secret-key") is False
+        assert is_valid_api_key("secret-key", "") is False
+
+
 class TestBuildReviewPrompt:
     """Tests for build_review_prompt function."""
 
@@ -502,6 +1248,101 @@ class TestBuildReviewPrompt:
         assert "function oldCode()" in prompt
         assert ".new-class" in prompt
 
+    def test_build_review_prompt_sends_hunks_for_edits(self, sample_pr):
+        """Edits are sent as unified diff hunks, without distant unchanged lines."""
+        target = "\n".join(f"line {i}" for i in range(100))
+        source = target.replace("line 50", "line fifty")
+        file_diffs = [{
+            "path": "/src/long.js",
+            "change_type": "edit",
+            "source_content": source,
+            "target_content": target,
+        }]
+        
+        prompt = build_review_prompt(sample_pr, file_diffs)
+        
+        assert "-line 50" in prompt
+        assert "+line fifty" in prompt
+        assert "line 10\n" not in prompt
+
+    def test_build_review_prompt_skipped_file_placeholder(self, sample_pr):
+        """Skipped files get a short placeholder instead of content."""
+        file_diffs = [{
+            "path": "/img/logo.png",
+            "change_type": "add",
+            "source_content": None,
+            "target_content": None,
+            "skip_reason": "binary or minified asset",
+        }]
+        
+        prompt = build_review_prompt(sample_pr, file_diffs)
+        
+        assert "## /img/logo.png" in prompt
+        assert "(binary or minified asset, not reviewed)" in prompt
+        assert "Added Content" not in prompt
+
+    def test_build_review_prompt_truncates_large_content(self, sample_pr):
+        """Each content block is capped at MAX_FILE_CHARS."""
+        file_diffs = [{
+            "path": "/src/big.js",
+            "change_type": "add",
+            "source_content": "x" * (main.MAX_FILE_CHARS + 500),
+            "target_content": None,
+        }]
+        
+        prompt = build_review_prompt(sample_pr, file_diffs)
+        
+        assert "x" * main.MAX_FILE_CHARS in prompt
+        assert "x" * (main.MAX_FILE_CHARS + 1) not in prompt
+        assert "(500 chars truncated)" in prompt
+
+    def test_build_review_prompt_lists_files_past_budget(self, sample_pr, mocker):
+        """Once MAX_PROMPT_CHARS is reached, remaining files are listed by name."""
+        mocker.patch.object(main, "MAX_PROMPT_CHARS", 1000)
+        file_diffs = [
+            {
+                "path": f"/src/file{i}.js",
+                "change_type": "add",
+                "source_content": "y" * 600,
+                "target_content": None,
+            }
+            for i in range(4)
+        ]
+        
+        prompt = build_review_prompt(sample_pr, file_diffs)
+        
+        assert "## /src/file0.js" in prompt
+        assert "## /src/file3.js" not in prompt
+        assert "Files not included (prompt size limit reached)" in prompt
+        assert "- /src/file3.js (add)" in prompt
+        assert prompt.endswith("Please provide your regression-focused review.")
+
+    def test_build_review_prompt_static_prefix_is_stable(self, sample_pr, sample_file_diffs):
+        """Different PRs share the same static instructions and prompt framing."""
+        other_pr = {**sample_pr, "title": "Something else", "pullRequestId": 999}
+        
+        first = build_review_prompt(sample_pr, sample_file_diffs)
+        second = build_review_prompt(other_pr, [])
+        
+        assert main.GENERATION_CONFIG.system_instruction == main.SYSTEM_PROMPT
+        assert first.startswith(main._PROMPT_HEADER)
+        assert second.startswith(main._PROMPT_HEADER)
+        assert first.endswith(main._PROMPT_FOOTER)
+        assert second.endswith(main._PROMPT_FOOTER)
+
+    def test_build_review_prompt_rename_without_changes(self, sample_pr):
+        """A rename with identical content says so instead of an empty diff."""
+        file_diffs = [{
+            "path": "/src/renamed.js",
+            "change_type": "rename",
+            "source_content": "same",
+            "target_content": "same",
+        }]
+        
+        prompt = build_review_prompt(sample_pr, file_diffs)
+        
+        assert "(no content changes)" in prompt
+
     def test_build_review_prompt_with_description(self, sample_pr, sample_file_diffs):
         """build_review_prompt includes PR description."""
         prompt = build_review_prompt(sample_pr, sample_file_diffs)
@@ -519,13 +1360,57 @@ class TestBuildReviewPrompt:
 # Idempotency Tests
 # =============================================================================
 
+class TestNeedsReview:
+    """Tests for needs_review and is_whitespace_only."""
+
+    @staticmethod
+    def _diff(path, target, source, **extra):
+        return {"path": path, "change_type": "edit", "target_content": target, "source_content": source} | extra
+
+    def test_code_change_needs_review(self):
+        """A real code change is sent to Gemini."""
+        assert needs_review(self._diff("/src/a.js", "return 1;", "return 2;"))
+
+    def test_docs_change_does_not(self):
+        """Markdown and text files alone don't warrant a review."""
+        assert not needs_review(self._diff("/README.MD", "old", "new"))
+        assert not needs_review(self._diff("/notes.txt", "old", "new"))
+
+    def test_whitespace_only_change_does_not(self):
+        """Re-indenting and blank lines are not worth a review."""
+        diff = self._diff("/src/a.js", "if (x) {\n  go();\n}", "if (x) {\n\n    go();\n}  ")
+        assert is_whitespace_only(diff)
+        assert not needs_review(diff)
+
+    def test_skipped_file_does_not(self):
+        """Binary or oversized files have nothing to review."""
+        assert not needs_review(self._diff("/a.png", None, None, skip_reason="binary file"))
+
+    def test_added_file_is_not_whitespace_only(self):
+        """A new non-empty file has significant changes."""
+        assert not is_whitespace_only(self._diff("/src/new.js", None, "code();"))
+
+    def test_failed_fetches_are_not_whitespace_only(self):
+        """An edit whose contents could not be fetched is still sent for review."""
+        diff = self._diff("/src/a.js", None, None)
+        assert not is_whitespace_only(diff)
+        assert needs_review(diff)
+
+    def test_rename_with_unchanged_content_needs_review(self):
+        """A pure rename or move can break references, so it is reviewed."""
+        for change_type in ("rename", "edit, rename"):
+            diff = self._diff("/src/b.js", "code();", "code();", change_type=change_type)
+            assert not is_whitespace_only(diff)
+            assert needs_review(diff)
+
+
 class TestCheckAndClaimProcessing:
     """Tests for check_and_claim_processing function."""
 
     def test_claim_success_when_marker_not_exists(self, mocker):
         """Returns True and creates marker when no existing marker."""
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -551,12 +1436,12 @@ class TestCheckAndClaimProcessing:
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_text.return_value = json.dumps({
+        mock_blob.download_as_bytes.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456",
             "status": "completed"
-        })
+        }).encode()
+        mock_blob.generation = 7
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -571,18 +1456,77 @@ class TestCheckAndClaimProcessing:
         assert result is False
         mock_blob.upload_from_string.assert_not_called()
 
+    def test_completed_marker_cached_in_process(self, mocker):
+        """A marker seen as completed is not read from GCS again."""
+        mock_blob = MagicMock()
+        mock_blob.download_as_bytes.return_value = b'{"status": "completed"}'
+        mock_client = MagicMock()
+        mock_client.bucket.return_value.blob.return_value = mock_blob
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        assert check_and_claim_processing("test-bucket", 12345, "abc123def456") is False
+        assert check_and_claim_processing("test-bucket", 12345, "abc123def456") is False
+        
+        mock_blob.download_as_bytes.assert_called_once()
+
+    def test_failed_marker_not_cached(self, mocker):
+        """Failed markers are re-read, since the DLQ reprocessor may reset them."""
+        mock_blob = MagicMock()
+        mock_blob.download_as_bytes.return_value = b'{"status": "failed", "retry_count": 3}'
+        mock_client = MagicMock()
+        mock_client.bucket.return_value.blob.return_value = mock_blob
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        check_and_claim_processing("test-bucket", 12345, "abc123def456")
+        check_and_claim_processing("test-bucket", 12345, "abc123def456")
+        
+        assert mock_blob.download_as_bytes.call_count == 2
+
+    def test_completed_marker_cache_is_bounded(self, mocker):
+        """The completed-marker cache evicts its least recently used entry."""
+        mocker.patch.object(main, "COMPLETED_MARKER_CACHE_MAX_ENTRIES", 2)
+        
+        main._remember_completed("b", 1, "sha")
+        main._remember_completed("b", 2, "sha")
+        main._remember_completed("b", 1, "sha")  # Refresh entry 1
+        main._remember_completed("b", 3, "sha")
+        
+        assert list(main._COMPLETED_MARKERS) == [("b", 1, "sha"), ("b", 3, "sha")]
+
+    def test_completed_marker_cache_survives_concurrent_access(self, mocker):
+        """Concurrent lookups, inserts and evictions neither raise nor overfill the cache."""
+        mocker.patch.object(main, "COMPLETED_MARKER_CACHE_MAX_ENTRIES", 16)
+        errors = []
+        
+        def worker(offset):
+            try:
+                for i in range(500):
+                    main._remember_completed("b", offset + i % 32, "sha")
+                    main._is_completed_cached("b", offset + (i + 1) % 32, "sha")
+            except Exception as e:  # pragma: no cover - only on a race
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert len(main._COMPLETED_MARKERS) <= 16
+
     def test_skip_when_marker_failed(self, mocker):
         """Returns False when marker exists with failed status."""
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_text.return_value = json.dumps({
+        mock_blob.download_as_bytes.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456",
             "status": "failed",
             "retry_count": 3
-        })
+        }).encode()
+        mock_blob.generation = 7
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -601,13 +1545,13 @@ class TestCheckAndClaimProcessing:
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_text.return_value = json.dumps({
+        mock_blob.download_as_bytes.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456",
             "status": "processing",
             "retry_count": 1
-        })
+        }).encode()
+        mock_blob.generation = 7
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -626,13 +1570,13 @@ class TestCheckAndClaimProcessing:
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_text.return_value = json.dumps({
+        mock_blob.download_as_bytes.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456",
             "status": "processing",
             "retry_count": MAX_RETRY_ATTEMPTS
-        })
+        }).encode()
+        mock_blob.generation = 7
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -646,10 +1590,36 @@ class TestCheckAndClaimProcessing:
         
         assert result is False
 
+    def test_reads_marker_with_single_get(self, mocker):
+        """The marker is read with one download, without a separate exists() call."""
+        mock_blob = MagicMock()
+        mock_blob.download_as_bytes.return_value = b'{"status": "completed"}'
+        mock_client = MagicMock()
+        mock_client.bucket.return_value.blob.return_value = mock_blob
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        assert check_and_claim_processing("test-bucket", 12345, "abc123def456") is False
+        
+        mock_blob.download_as_bytes.assert_called_once()
+        mock_blob.exists.assert_not_called()
+
+    def test_replaces_corrupted_marker_at_read_generation(self, mocker):
+        """A corrupted marker is overwritten only if unchanged since it was read."""
+        mock_blob = MagicMock()
+        mock_blob.download_as_bytes.return_value = b"not json"
+        mock_blob.generation = 42
+        mock_client = MagicMock()
+        mock_client.bucket.return_value.blob.return_value = mock_blob
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        assert check_and_claim_processing("test-bucket", 12345, "abc123def456") is True
+        
+        assert mock_blob.upload_from_string.call_args[1]["if_generation_match"] == 42
+
     def test_skip_on_race_condition(self, mocker):
         """Returns False when another instance claimed marker (PreconditionFailed)."""
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
         mock_blob.upload_from_string.side_effect = PreconditionFailed("Precondition failed")
         
         mock_bucket = MagicMock()
@@ -669,7 +1639,7 @@ class TestCheckAndClaimProcessing:
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -681,8 +1651,9 @@ class TestCheckAndClaimProcessing:
         
         check_and_claim_processing("test-bucket", 12345, "abc123def456")
         
-        # Get the JSON content that was uploaded
+        # Get the JSON content that was uploaded (pre-serialized bytes)
         uploaded_content = mock_blob.upload_from_string.call_args[0][0]
+        assert isinstance(uploaded_content, bytes)
         marker = json.loads(uploaded_content)
         
         assert marker["pr_id"] == 12345
@@ -724,6 +1695,18 @@ class TestUpdateMarkerCompleted:
         assert marker["commented"] is True
         assert "processed_at" in marker
 
+    def test_marker_helpers_share_storage_client(self, mocker):
+        """Claiming and completing a marker build the storage client only once."""
+        mock_client = MagicMock()
+        mock_client.bucket.return_value.blob.return_value.download_as_bytes.side_effect = main.NotFound("no marker")
+        mock_factory = mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        check_and_claim_processing("test-bucket", 12345, "abc123def456")
+        update_marker_completed("test-bucket", 12345, "abc123def456", "note", False)
+        
+        mock_factory.assert_called_once()
+        mock_client.bucket.assert_called_once_with("test-bucket")
+
 
 class TestUpdateMarkerForRetry:
     """Tests for update_marker_for_retry function."""
@@ -733,13 +1716,13 @@ class TestUpdateMarkerForRetry:
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_text.return_value = json.dumps({
+        mock_blob.download_as_bytes.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456",
             "status": "processing",
             "retry_count": 0
-        })
+        }).encode()
+        mock_blob.generation = 7
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -758,19 +1741,21 @@ class TestUpdateMarkerForRetry:
         marker = json.loads(uploaded_content)
         assert marker["retry_count"] == 1
         assert marker["status"] == "processing"
+        # Update is conditional on the generation that was read
+        assert mock_blob.upload_from_string.call_args[1]["if_generation_match"] == 7
 
     def test_max_retries_returns_false(self, mocker):
         """Returns False when max retries exceeded."""
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_text.return_value = json.dumps({
+        mock_blob.download_as_bytes.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456",
             "status": "processing",
             "retry_count": MAX_RETRY_ATTEMPTS - 1  # One more will exceed
-        })
+        }).encode()
+        mock_blob.generation = 7
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -795,7 +1780,7 @@ class TestUpdateMarkerForRetry:
         import json
         
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -812,6 +1797,50 @@ class TestUpdateMarkerForRetry:
         uploaded_content = mock_blob.upload_from_string.call_args[0][0]
         marker = json.loads(uploaded_content)
         assert marker["retry_count"] == 1
+        assert mock_blob.upload_from_string.call_args[1]["if_generation_match"] == 0
+
+    def test_cas_retry_on_concurrent_update(self, mocker):
+        """Re-reads the marker and retries when another attempt updated it first."""
+        import json
+        
+        mock_blob = MagicMock()
+        mock_blob.download_as_bytes.side_effect = [
+            json.dumps({"status": "processing", "retry_count": 0}).encode(),
+            json.dumps({"status": "processing", "retry_count": 1}).encode(),
+        ]
+        mock_blob.generation = 7
+        mock_blob.upload_from_string.side_effect = [PreconditionFailed("generation changed"), None]
+        
+        mock_bucket = MagicMock()
+        mock_bucket.blob.return_value = mock_blob
+        mock_client = MagicMock()
+        mock_client.bucket.return_value = mock_bucket
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        result = update_marker_for_retry("test-bucket", 12345, "abc123def456", "Test error")
+        
+        assert result is True
+        assert mock_blob.download_as_bytes.call_count == 2
+        # The increment is applied on top of the concurrent update
+        marker = json.loads(mock_blob.upload_from_string.call_args[0][0])
+        assert marker["retry_count"] == 2
+
+    def test_cas_gives_up_after_max_attempts(self, mocker):
+        """Raises PreconditionFailed when every conditional write loses the race."""
+        mock_blob = MagicMock()
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
+        mock_blob.upload_from_string.side_effect = PreconditionFailed("generation changed")
+        
+        mock_bucket = MagicMock()
+        mock_bucket.blob.return_value = mock_blob
+        mock_client = MagicMock()
+        mock_client.bucket.return_value = mock_bucket
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        with pytest.raises(PreconditionFailed):
+            update_marker_for_retry("test-bucket", 12345, "abc123def456", "Test error")
+        
+        assert mock_blob.upload_from_string.call_count == main.MARKER_CAS_ATTEMPTS
 
 
 class TestUpdateMarkerFailed:
@@ -866,13 +1895,109 @@ class TestUpdateMarkerFailed:
         assert len(marker["error"]) == 500
 
 
+class TestResetMarkers:
+    """Tests for reset_markers function."""
+
+    def test_batches_multiple_deletes(self, mocker):
+        """Several markers are deleted inside one storage batch."""
+        mock_client = MagicMock()
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        bucket = mock_client.bucket.return_value
+        
+        main.reset_markers("test-bucket", [(1, "aaa1111"), (2, "bbb2222")])
+        
+        mock_client.batch.assert_called_once()
+        assert [call.args[0] for call in bucket.blob.call_args_list] == [
+            "idempotency/pr-1-aaa1111.json",
+            "idempotency/pr-2-bbb2222.json",
+        ]
+        assert bucket.blob.return_value.delete.call_count == 2
+
+    def test_splits_large_resets_into_batches(self, mocker):
+        """More markers than GCS_BATCH_MAX_CALLS need more than one batch."""
+        mock_client = MagicMock()
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        
+        items = [(i, "abc1234") for i in range(main.GCS_BATCH_MAX_CALLS + 1)]
+        main.reset_markers("test-bucket", items)
+        
+        assert mock_client.batch.call_count == 2
+
+    def test_single_marker_skips_batch(self, mocker):
+        """A single marker is deleted directly, and a missing one is ignored."""
+        mock_client = MagicMock()
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        blob = mock_client.bucket.return_value.blob.return_value
+        blob.delete.side_effect = main.NotFound("gone")
+        
+        main.reset_markers("test-bucket", [(1, "aaa1111")])
+        
+        mock_client.batch.assert_not_called()
+        blob.delete.assert_called_once()
+
+    @staticmethod
+    def _blobs_by_name(bucket):
+        """Give each marker path its own blob mock."""
+        blobs = {}
+        
+        def blob(name):
+            if name not in blobs:
+                blobs[name] = MagicMock()
+                blobs[name].name = name
+            return blobs[name]
+        
+        bucket.blob.side_effect = blob
+        return blobs
+
+    def test_batched_deletes_pass_timeout(self, mocker):
+        """Deletes queued in a batch keep the per-request GCS timeout."""
+        mock_client = MagicMock()
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        blobs = self._blobs_by_name(mock_client.bucket.return_value)
+        
+        main.reset_markers("test-bucket", [(1, "aaa1111"), (2, "bbb2222")])
+        
+        for blob in blobs.values():
+            blob.delete.assert_called_once_with(timeout=main.GCS_TIMEOUT_SECONDS)
+
+    def test_failed_batch_retries_each_marker(self, mocker):
+        """A failed batch is redone per blob, and markers already gone are ignored."""
+        mock_client = MagicMock()
+        mock_client.batch.return_value.__exit__.side_effect = main.NotFound("gone")
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        blobs = self._blobs_by_name(mock_client.bucket.return_value)
+        first = mock_client.bucket.return_value.blob("idempotency/pr-1-aaa1111.json")
+        first.delete.side_effect = [None, main.NotFound("gone")]  # Queued in the batch, then retried
+        
+        main.reset_markers("test-bucket", [(1, "aaa1111"), (2, "bbb2222")])
+        
+        assert [blob.delete.call_count for blob in blobs.values()] == [2, 2]
+
+    def test_other_batch_failures_are_not_hidden_by_404(self, mocker):
+        """A 503 on one marker is raised even when another marker was a 404."""
+        mock_client = MagicMock()
+        mock_client.batch.return_value.__exit__.side_effect = main.NotFound("gone")
+        mocker.patch("main.storage.Client", return_value=mock_client)
+        self._blobs_by_name(mock_client.bucket.return_value)
+        first = mock_client.bucket.return_value.blob("idempotency/pr-1-aaa1111.json")
+        second = mock_client.bucket.return_value.blob("idempotency/pr-2-bbb2222.json")
+        first.delete.side_effect = [None, main.NotFound("gone")]
+        second.delete.side_effect = [None, main.exceptions.ServiceUnavailable("busy")]
+        
+        with pytest.raises(main.exceptions.ServiceUnavailable) as excinfo:
+            main.reset_markers("test-bucket", [(1, "aaa1111"), (2, "bbb2222")])
+        
+        assert "pr-2-bbb2222" in str(excinfo.value)
+        assert "pr-1-aaa1111" not in str(excinfo.value)
+
+
 class TestIdempotencyKeyFormat:
     """Tests verifying the idempotency key format."""
 
     def test_different_commits_same_pr_have_different_keys(self, mocker):
         """Same PR with different commits creates different marker paths."""
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -897,7 +2022,7 @@ class TestIdempotencyKeyFormat:
     def test_same_commit_different_prs_have_different_keys(self, mocker):
         """Same commit on different PRs creates different marker paths."""
         mock_blob = MagicMock()
-        mock_blob.exists.return_value = False
+        mock_blob.download_as_bytes.side_effect = main.NotFound("no marker")
         
         mock_bucket = MagicMock()
         mock_bucket.blob.return_value = mock_blob
@@ -920,6 +2045,136 @@ class TestIdempotencyKeyFormat:
         assert "pr-22222" in second_call_path
 
 
+# =============================================================================
+# Review Entry Point Tests
+# =============================================================================
+
+REVIEW_ENV = {
+    "API_KEY": "test-key",
+    "GCS_BUCKET": "test-bucket",
+    "AZURE_DEVOPS_PAT": "fake-pat-token",
+    "AZURE_DEVOPS_ORG": "test-org",
+    "AZURE_DEVOPS_PROJECT": "test-project",
+    "AZURE_DEVOPS_REPO": "test-repo",
+    "VERTEX_PROJECT": "test-project",
+}
+
+DOCS_ONLY_DIFFS = [{
+    "path": "/README.md",
+    "change_type": "edit",
+    "source_content": "New docs",
+    "target_content": "Old docs",
+}]
+
+
+class TestReviewPr:
+    """Tests for the review_pr HTTP entry point."""
+
+    @pytest.fixture
+    def mock_ado(self, mocker, sample_pr):
+        mocker.patch.dict("os.environ", REVIEW_ENV)
+        ado = MagicMock()
+        ado.get_pull_request_with_changes.return_value = (sample_pr, [])
+        mocker.patch("main._get_ado_client", return_value=ado)
+        return ado
+
+    @pytest.fixture
+    def mock_request(self):
+        request = MagicMock()
+        request.headers = {"X-API-Key": "test-key"}
+        request.get_json.return_value = {"pr_id": 12345}
+        return request
+
+    def test_fetches_metadata_and_changes_together(self, mock_ado, mock_request, mocker, sample_pr):
+        """review_pr lists changes in one call and hands them to get_pr_diff."""
+        mock_ado.get_pr_diff.return_value = DOCS_ONLY_DIFFS
+        
+        review_pr(mock_request)
+        
+        mock_ado.get_pull_request_with_changes.assert_called_once_with(12345)
+        mock_ado.get_pull_request.assert_not_called()
+        mock_ado.get_pr_diff.assert_called_once_with(12345, pr=sample_pr, changes=[])
+
+    def test_pr_not_ready_returns_409(self, mock_ado, mock_request):
+        """A PR whose merge commit isn't computed yet is reported as a conflict."""
+        mock_ado.get_pr_diff.side_effect = PRNotReadyError("merge commit not ready")
+        
+        response, status, _ = review_pr(mock_request)
+        
+        assert status == 409
+        assert "not ready" in json.loads(response)["error"]
+
+    def test_docs_only_changes_skip_review(self, mock_ado, mock_request, mocker):
+        """Docs-only PRs return without calling Gemini."""
+        mock_ado.get_pr_diff.return_value = DOCS_ONLY_DIFFS
+        mock_process = mocker.patch("main.process_pr_review")
+        
+        response, status, _ = review_pr(mock_request)
+        
+        assert status == 200
+        assert json.loads(response)["storage_path"] is None
+        mock_process.assert_not_called()
+
+
+class TestReviewPrPubsub:
+    """Tests for the review_pr_pubsub Pub/Sub entry point."""
+
+    @staticmethod
+    def _event(message):
+        event = MagicMock()
+        event.data = {"message": {"data": base64.b64encode(json.dumps(message).encode()).decode()}}
+        return event
+
+    @pytest.fixture
+    def mock_ado(self, mocker, sample_pr):
+        mocker.patch.dict("os.environ", REVIEW_ENV)
+        ado = MagicMock()
+        ado.get_pull_request.return_value = sample_pr
+        mocker.patch("main._get_ado_client", return_value=ado)
+        return ado
+
+    def test_already_processed_skips_change_listing(self, mock_ado, mocker):
+        """A duplicate delivery costs one metadata call and never lists changes."""
+        mocker.patch("main.check_and_claim_processing", return_value=False)
+        
+        review_pr_pubsub(self._event({"pr_id": 12345, "commit_sha": "abc123def456"}))
+        
+        mock_ado.get_pull_request.assert_called_once_with(12345)
+        mock_ado.get_pr_diff.assert_not_called()
+        mock_ado.get_pull_request_with_changes.assert_not_called()
+
+    def test_pr_not_ready_counts_retry_and_reraises(self, mock_ado, mocker):
+        """PRNotReadyError records a retry and re-raises so Pub/Sub redelivers."""
+        mocker.patch("main.check_and_claim_processing", return_value=True)
+        mock_retry = mocker.patch("main.update_marker_for_retry", return_value=True)
+        mock_ado.get_pr_diff.side_effect = PRNotReadyError("merge commit not ready")
+        
+        with pytest.raises(PRNotReadyError):
+            review_pr_pubsub(self._event({"pr_id": 12345, "commit_sha": "abc123def456"}))
+        
+        mock_retry.assert_called_once_with("test-bucket", 12345, "abc123def456", "merge commit not ready")
+
+    def test_pr_not_ready_acknowledged_when_retries_exhausted(self, mock_ado, mocker):
+        """Once retries run out the message is acknowledged instead of re-raised."""
+        mocker.patch("main.check_and_claim_processing", return_value=True)
+        mocker.patch("main.update_marker_for_retry", return_value=False)
+        mock_ado.get_pr_diff.side_effect = PRNotReadyError("merge commit not ready")
+        
+        assert review_pr_pubsub(self._event({"pr_id": 12345, "commit_sha": "abc123def456"})) is None
+
+    def test_docs_only_changes_marked_completed(self, mock_ado, mocker):
+        """Docs-only PRs complete the marker without calling Gemini."""
+        mocker.patch("main.check_and_claim_processing", return_value=True)
+        mock_completed = mocker.patch("main.update_marker_completed")
+        mock_process = mocker.patch("main.process_pr_review")
+        mock_ado.get_pr_diff.return_value = DOCS_ONLY_DIFFS
+        
+        review_pr_pubsub(self._event({"pr_id": 12345, "commit_sha": "abc123def456"}))
+        
+        mock_completed.assert_called_once_with("test-bucket", 12345, "abc123def456", "info", False)
+        mock_process.assert_not_called()
+
+
 # =============================================================================
 # Webhook Receiver Tests
 # =============================================================================
@@ -928,7 +2183,7 @@ class TestLoadWebhookConfig:
     """Tests for load_webhook_config function."""
 
     def test_load_webhook_config_success(self, mocker):
-        """Returns config dict when all required vars present."""
+        """Returns config when all required vars present."""
         mocker.patch.dict("os.environ", {
             "API_KEY": "test-api-key",
             "VERTEX_PROJECT": "test-project",
@@ -937,9 +2192,9 @@ class TestLoadWebhookConfig:
         config, missing = load_webhook_config()
         
         assert missing == []
-        assert config["API_KEY"] == "test-api-key"
-        assert config["VERTEX_PROJECT"] == "test-project"
-        assert config["PUBSUB_TOPIC"] == "pr-review-trigger"  # default
+        assert config.api_key == "test-api-key"
+        assert config.vertex_project == "test-project"
+        assert config.pubsub_topic == "pr-review-trigger"  # default
 
     def test_load_webhook_config_custom_topic(self, mocker):
         """Uses custom PUBSUB_TOPIC when provided."""
@@ -951,7 +2206,7 @@ class TestLoadWebhookConfig:
         
         config, missing = load_webhook_config()
         
-        assert config["PUBSUB_TOPIC"] == "custom-topic"
+        assert config.pubsub_topic == "custom-topic"
 
     def test_load_webhook_config_missing_vars(self, mocker):
         """Returns missing vars list when required vars missing."""
@@ -962,6 +2217,38 @@ class TestLoadWebhookConfig:
         assert "API_KEY" in missing
         assert "VERTEX_PROJECT" in missing
 
+    def test_load_webhook_config_cached(self, mocker):
+        """Reads the environment once and reuses the config until reloaded."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-api-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        first, _ = load_webhook_config()
+        
+        mocker.patch.dict("os.environ", {"API_KEY": "rotated-key"})
+        second, _ = load_webhook_config()
+        reloaded = main._reload_config()
+        
+        assert second is first
+        assert reloaded.api_key == "rotated-key"
+
+
+class TestBuildWebhookMessage:
+    """Tests for build_webhook_message function."""
+
+    def test_matches_serialized_dict(self):
+        """Produces the same bytes as serializing the equivalent dict."""
+        import orjson
+
+        message_bytes = build_webhook_message(12345, "abc123def456789", "2026-01-03T10:30:00.123+00:00")
+
+        assert message_bytes == orjson.dumps({
+            "pr_id": 12345,
+            "commit_sha": "abc123def456789",
+            "received_at": "2026-01-03T10:30:00.123+00:00",
+            "source": "azure-devops-pipeline",
+        })
+
 
 class TestReceiveWebhook:
     """Tests for receive_webhook function."""
@@ -971,7 +2258,8 @@ class TestReceiveWebhook:
         """Create a mock Flask request object."""
         request = MagicMock()
         request.headers = {}
-        request.get_json = MagicMock(return_value={})
+        request.content_length = None  # Chunked unless a test declares a length
+        request.get_data = MagicMock(return_value=b"{}")
         return request
 
     def test_missing_api_key_header(self, mock_request, mocker):
@@ -1000,6 +2288,20 @@ class TestReceiveWebhook:
         assert status == 401
         assert "Invalid API key" in response["error"]
 
+    def test_api_key_compared_in_constant_time(self, mock_request, mocker):
+        """The webhook checks the key with hmac.compare_digest."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "correct-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "wrong-key"}
+        compare = mocker.patch("main.hmac.compare_digest", return_value=False)
+        
+        _, status = receive_webhook(mock_request)
+        
+        assert status == 401
+        compare.assert_called_once_with(b"wrong-key", b"correct-key")
+
     def test_missing_pr_id(self, mock_request, mocker):
         """Returns 400 when pr_id is missing."""
         mocker.patch.dict("os.environ", {
@@ -1007,7 +2309,7 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {"commit_sha": "abc123def"}
+        mock_request.get_data.return_value = json.dumps({"commit_sha": "abc123def"}).encode()
         
         response, status = receive_webhook(mock_request)
         
@@ -1021,7 +2323,7 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {"pr_id": 12345}
+        mock_request.get_data.return_value = json.dumps({"pr_id": 12345}).encode()
         
         response, status = receive_webhook(mock_request)
         
@@ -1035,7 +2337,7 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {"pr_id": "not-a-number", "commit_sha": "abc123def"}
+        mock_request.get_data.return_value = json.dumps({"pr_id": "not-a-number", "commit_sha": "abc123def"}).encode()
         
         response, status = receive_webhook(mock_request)
         
@@ -1049,13 +2351,41 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {"pr_id": 12345, "commit_sha": "abc"}
+        mock_request.get_data.return_value = json.dumps({"pr_id": 12345, "commit_sha": "abc"}).encode()
         
         response, status = receive_webhook(mock_request)
         
         assert status == 400
         assert "7 characters" in response["error"]
 
+    def test_commit_sha_not_hex(self, mock_request, mocker):
+        """Returns 400 when commit_sha contains non-hex characters."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = json.dumps({"pr_id": 12345, "commit_sha": "abc123def\n"}).encode()
+        
+        response, status = receive_webhook(mock_request)
+        
+        assert status == 400
+        assert "hex" in response["error"]
+
+    def test_pr_id_bool_rejected(self, mock_request, mocker):
+        """Returns 400 when pr_id is a boolean rather than an integer."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = json.dumps({"pr_id": True, "commit_sha": "abc123def"}).encode()
+        
+        response, status = receive_webhook(mock_request)
+        
+        assert status == 400
+        assert "integer" in response["error"]
+
     def test_successful_publish(self, mock_request, mocker):
         """Returns 202 and publishes to Pub/Sub on success."""
         mocker.patch.dict("os.environ", {
@@ -1064,10 +2394,10 @@ class TestReceiveWebhook:
             "PUBSUB_TOPIC": "test-topic",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {
+        mock_request.get_data.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456789"
-        }
+        }).encode()
         
         # Mock Pub/Sub client
         mock_future = MagicMock()
@@ -1087,9 +2417,130 @@ class TestReceiveWebhook:
         assert response["pr_id"] == 12345
         assert response["commit_sha"] == "abc123de"  # truncated to 8 chars
         
-        # Verify Pub/Sub was called correctly
+        # Verify Pub/Sub was called correctly and acked before responding
         mock_publisher.topic_path.assert_called_once_with("test-project", "test-topic")
         mock_publisher.publish.assert_called_once()
+        mock_future.result.assert_called_once()
+
+    def test_failed_publish_is_not_deduplicated(self, mock_request, mocker):
+        """A publish whose ack fails returns 500 and a retried delivery is published again."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = json.dumps({
+            "pr_id": 12345,
+            "commit_sha": "abc123def456789"
+        }).encode()
+        
+        mock_future = MagicMock()
+        mock_future.result.side_effect = Exception("Pub/Sub error")
+        mock_publisher = MagicMock()
+        mock_publisher.publish.return_value = mock_future
+        mocker.patch("main.pubsub_v1.PublisherClient", return_value=mock_publisher)
+        
+        _, first_status = receive_webhook(mock_request)
+        _, second_status = receive_webhook(mock_request)
+        
+        assert first_status == second_status == 500
+        assert mock_publisher.publish.call_count == 2
+
+    def test_publishes_share_batching_publisher(self, mock_request, mocker):
+        """Webhooks publish through one batching client so concurrent messages coalesce."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_publisher_cls = mocker.patch("main.pubsub_v1.PublisherClient")
+        
+        for commit_sha in ("abc123def456789", "fed987cba654321"):
+            mock_request.get_data.return_value = json.dumps({
+                "pr_id": 12345,
+                "commit_sha": commit_sha
+            }).encode()
+            receive_webhook(mock_request)
+        
+        mock_publisher_cls.assert_called_once_with(batch_settings=main.PUBSUB_BATCH_SETTINGS)
+        assert mock_publisher_cls.return_value.publish.call_count == 2
+        # Topic path is built once and reused
+        mock_publisher_cls.return_value.topic_path.assert_called_once()
+        assert main.PUBSUB_BATCH_SETTINGS.max_latency <= 0.01  # Webhook blocks on the ack
+
+    def test_duplicate_delivery_not_republished(self, mock_request, mocker):
+        """A repeated PR+commit within the dedup window reuses the first message_id."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = json.dumps({
+            "pr_id": 12345,
+            "commit_sha": "abc123def456789"
+        }).encode()
+        
+        mock_future = MagicMock()
+        mock_future.result.return_value = "message-id-123"
+        
+        mock_publisher = MagicMock()
+        mock_publisher.publish.return_value = mock_future
+        
+        mocker.patch("main.pubsub_v1.PublisherClient", return_value=mock_publisher)
+        
+        first_response, first_status = receive_webhook(mock_request)
+        second_response, second_status = receive_webhook(mock_request)
+        
+        assert first_status == second_status == 202
+        assert first_response["status"] == "queued"
+        assert second_response["status"] == "duplicate_suppressed"
+        assert second_response["message_id"] == "message-id-123"
+        mock_publisher.publish.assert_called_once()
+
+    def test_duplicate_after_window_is_republished(self, mock_request, mocker):
+        """A repeated PR+commit after the dedup window is published again."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = json.dumps({
+            "pr_id": 12345,
+            "commit_sha": "abc123def456789"
+        }).encode()
+        
+        mock_publisher = MagicMock()
+        mock_publisher.publish.return_value.result.return_value = "message-id-123"
+        mocker.patch("main.pubsub_v1.PublisherClient", return_value=mock_publisher)
+        mock_clock = mocker.patch("main.time.monotonic", return_value=1000.0)
+        
+        receive_webhook(mock_request)
+        mock_clock.return_value = 1000.0 + main.WEBHOOK_DEDUP_TTL_SECONDS
+        receive_webhook(mock_request)
+        
+        assert mock_publisher.publish.call_count == 2
+
+    def test_dedup_cache_survives_concurrent_publishes(self, mocker):
+        """Concurrent records that prune the full cache neither raise nor overfill it."""
+        mocker.patch.object(main, "WEBHOOK_DEDUP_MAX_ENTRIES", 16)
+        errors = []
+        
+        def worker(offset):
+            try:
+                for i in range(500):
+                    main._record_publish(offset * 1000 + i, "sha", "message-id")
+                    main._get_recent_publish(offset * 1000 + i, "sha")
+            except Exception as e:  # pragma: no cover - only on a race
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert len(main._WEBHOOK_DEDUP) <= 16
 
     def test_pubsub_message_format(self, mock_request, mocker):
         """Verifies the Pub/Sub message contains expected fields."""
@@ -1100,10 +2551,10 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {
+        mock_request.get_data.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456789"
-        }
+        }).encode()
         
         mock_future = MagicMock()
         mock_future.result.return_value = "msg-123"
@@ -1125,6 +2576,10 @@ class TestReceiveWebhook:
         assert message["commit_sha"] == "abc123def456789"
         assert message["source"] == "azure-devops-pipeline"
         assert "received_at" in message
+        # Millisecond-precision ISO timestamp, e.g. 2026-01-03T10:30:00.123+00:00
+        received_at = datetime.fromisoformat(message["received_at"])
+        assert received_at.tzinfo is not None
+        assert len(message["received_at"].split(".")[1]) == len("123+00:00")
 
     def test_pubsub_publish_failure(self, mock_request, mocker):
         """Returns 500 when Pub/Sub publish fails."""
@@ -1133,10 +2588,10 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {
+        mock_request.get_data.return_value = json.dumps({
             "pr_id": 12345,
             "commit_sha": "abc123def456789"
-        }
+        }).encode()
         
         mock_publisher = MagicMock()
         mock_publisher.topic_path.return_value = "projects/test-project/topics/test-topic"
@@ -1165,13 +2620,41 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.side_effect = Exception("Invalid JSON")
+        mock_request.get_data.return_value = b"{not valid json"
         
         response, status = receive_webhook(mock_request)
         
         assert status == 400
         assert "Invalid JSON" in response["error"]
 
+    def test_invalid_utf8_body(self, mock_request, mocker):
+        """Returns 400 when the body is not valid UTF-8."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = b'{"pr_id": "\xff"}'
+        
+        response, status = receive_webhook(mock_request)
+        
+        assert status == 400
+        assert "Invalid JSON" in response["error"]
+
+    def test_non_object_json_body(self, mock_request, mocker):
+        """Returns 400 when the JSON body is not an object."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = b'[12345, "abc1234"]'
+        
+        response, status = receive_webhook(mock_request)
+        
+        assert status == 400
+        assert "JSON object" in response["error"]
+
     def test_empty_request_body(self, mock_request, mocker):
         """Returns 400 when request body is empty."""
         mocker.patch.dict("os.environ", {
@@ -1179,13 +2662,42 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = None
+        mock_request.get_data.return_value = b""
         
         response, status = receive_webhook(mock_request)
         
         assert status == 400
         assert "Empty" in response["error"]
 
+    def test_request_body_too_large(self, mock_request, mocker):
+        """Returns 413 without parsing when the body exceeds the size limit."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.get_data.return_value = b" " * (main.WEBHOOK_MAX_BODY_BYTES + 1)
+        mock_loads = mocker.patch("main.orjson.loads")
+        
+        response, status = receive_webhook(mock_request)
+        
+        assert status == 413
+        mock_loads.assert_not_called()
+
+    def test_declared_body_too_large_is_not_read(self, mock_request, mocker):
+        """Returns 413 from the Content-Length header without reading the body."""
+        mocker.patch.dict("os.environ", {
+            "API_KEY": "test-key",
+            "VERTEX_PROJECT": "test-project",
+        })
+        mock_request.headers = {"X-API-Key": "test-key"}
+        mock_request.content_length = main.WEBHOOK_MAX_BODY_BYTES + 1
+        
+        response, status = receive_webhook(mock_request)
+        
+        assert status == 413
+        mock_request.get_data.assert_not_called()
+
     def test_pr_id_as_string_integer(self, mock_request, mocker):
         """Accepts pr_id as string that can be parsed as integer."""
         mocker.patch.dict("os.environ", {
@@ -1193,10 +2705,10 @@ class TestReceiveWebhook:
             "VERTEX_PROJECT": "test-project",
         })
         mock_request.headers = {"X-API-Key": "test-key"}
-        mock_request.get_json.return_value = {
+        mock_request.get_data.return_value = json.dumps({
             "pr_id": "12345",  # String, not int
             "commit_sha": "abc123def456789"
-        }
+        }).encode()
         
         mock_future = MagicMock()
         mock_future.result.return_value = "msg-123"
@@ -1212,3 +2724,57 @@ class TestReceiveWebhook:
         assert status == 202
         assert response["pr_id"] == 12345  # Converted to int
 
+
+# =============================================================================
+# Cold Start Warm-up Tests
+# =============================================================================
+
+class TestWarm:
+    """Tests for _warm cold-start initialization."""
+
+    def test_warm_webhook_builds_publisher_only(self, mocker):
+        """Webhook target warms the Pub/Sub publisher and nothing else."""
+        mocker.patch.dict("os.environ", {"FUNCTION_TARGET": "receive_webhook"}, clear=True)
+        mock_publisher_cls = mocker.patch("main.pubsub_v1.PublisherClient")
+        mock_storage_cls = mocker.patch("main.storage.Client")
+        mock_genai_cls = mocker.patch("main.genai.Client")
+
+        main._warm()
+
+        mock_publisher_cls.assert_called_once()
+        mock_storage_cls.assert_not_called()
+        mock_genai_cls.assert_not_called()
+        assert main._PUBLISHER is mock_publisher_cls.return_value
+
+    def test_warm_review_builds_storage_and_gemini(self, mocker):
+        """Review targets warm the GCS bucket and the GenAI client."""
+        mocker.patch.dict("os.environ", {
+            "FUNCTION_TARGET": "review_pr_pubsub",
+            "GCS_BUCKET": "test-bucket",
+            "VERTEX_PROJECT": "test-project",
+        }, clear=True)
+        mock_storage_cls = mocker.patch("main.storage.Client")
+        mock_genai_cls = mocker.patch("main.genai.Client")
+
+        main._warm()
+
+        mock_bucket = mock_storage_cls.return_value.bucket.return_value
+        mock_bucket.get_blob.assert_called_once_with("idempotency/warm-up.json", timeout=main.GCS_TIMEOUT_SECONDS)
+        mock_bucket.exists.assert_not_called()  # Would need storage.buckets.get
+        mock_genai_cls.assert_called_once_with(
+            vertexai=True, project="test-project", location="us-central1"
+        )
+
+    def test_warm_failure_is_not_raised(self, mocker):
+        """Warm-up errors are logged instead of breaking module import."""
+        mocker.patch.dict("os.environ", {
+            "FUNCTION_TARGET": "review_pr",
+            "GCS_BUCKET": "test-bucket",
+            "VERTEX_PROJECT": "test-project",
+        }, clear=True)
+        mocker.patch("main.storage.Client", side_effect=Exception("no credentials"))
+        mock_genai_cls = mocker.patch("main.genai.Client")
+
+        main._warm()
+
+        mock_genai_cls.assert_called_once()
@@ -1,21 +1,42 @@
 #!/usr/bin/env python3
-"""Quick test to verify Vertex AI / Gemini access using the new Google GenAI SDK."""
+"""Quick test to verify Vertex AI / Gemini access using the new Google GenAI SDK.
+
+Run directly: python test_vertex.py. Nothing runs on import, so pytest can
+collect this directory without calling Vertex AI.
+"""
+
+from collections.abc import Iterator
 
 from google import genai
 
-# Initialize the GenAI client for Vertex AI
-# This automatically uses Application Default Credentials (ADC)
-client = genai.Client(
-    vertexai=True,  # Use Vertex AI backend
-    project="rawl-extractor",  # Replace with your project
-    location="europe-west1",
-)
-
-# Generate content using the new SDK
-response = client.models.generate_content(
-    model="gemini-2.0-flash-001",
-    contents="Say 'Hello RAWL 9001!' and nothing else.",
-)
-
-print("✅ Google GenAI SDK connection successful!")
-print(f"Response: {response.text}")
+PROJECT = "rawl-extractor"  # Replace with your project
+LOCATION = "europe-west1"
+MODEL = "gemini-2.0-flash-001"
+
+
+def stream_review(client: genai.Client, prompt: str) -> Iterator[str]:
+    """Yield response text as Gemini generates it."""
+    for chunk in client.models.generate_content_stream(model=MODEL, contents=prompt):
+        if chunk.text:
+            yield chunk.text
+
+
+def main() -> None:
+    # Initialize the GenAI client for Vertex AI
+    # This automatically uses Application Default Credentials (ADC)
+    client = genai.Client(
+        vertexai=True,  # Use Vertex AI backend
+        project=PROJECT,
+        location=LOCATION,
+    )
+
+    # Stream so the first tokens print as soon as they are generated
+    print("Response: ", end="", flush=True)
+    for text in stream_review(client, "Say 'Hello RAWL 9001!' and nothing else."):
+        print(text, end="", flush=True)
+    print()
+    print("✅ Google GenAI SDK connection successful!")
+
+
+if __name__ == "__main__":
+    main()